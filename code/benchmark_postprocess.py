@@ -0,0 +1,125 @@
+"""
+Benchmark of the HTML post-processing that server.after() applies to every
+page, comparing the single-parse implementation in server.postprocess_html()
+to the former string to dom to string to dom round-trip.
+
+Usage: python benchmark_postprocess.py [repetitions] [page ...]
+
+Pages are paths relative to the documentation base url. Needs the generated
+schema resources in the working directory, like server.py.
+"""
+
+import sys
+import time
+import statistics
+
+from flask import url_for
+
+import server
+from server import app, BeautifulSoup, FigureNumberer, R, ifcre
+
+PAGES = [
+    "lexical/IfcWall.htm",
+    "lexical/IfcBuildingElementProxy.htm",
+    "content/terms_and_definitions.htm",
+]
+
+
+def two_pass_postprocess(html):
+    # The post-processing as it used to be implemented in server.after()
+    numberer = FigureNumberer()
+
+    soup = BeautifulSoup(html)
+
+    try:
+        h1 = soup.findAll("h1")[0]
+    except:
+        return None
+
+    title = soup.findAll("title")[0]
+    title.string = title_string = h1.text + " - " + title.string
+
+    main_content = soup.find_all(id="main-content")
+    main_content = main_content[0] if len(main_content) else None
+
+    if main_content:
+        server.number_figures(soup, main_content, numberer)
+
+    server.insert_anchors(soup)
+
+    html = numberer.replace_references(str(soup))
+
+    def case_norm(v):
+        x = v.upper()
+        n = {k.upper(): k for k in R.entity_definitions.keys()}.get(x)
+        if n: return n
+        n = {k.upper(): k for k in R.pset_definitions.keys()}.get(x)
+        if n: return n
+        return v
+
+    def decorate_link(m):
+        w = m.group(0)
+        fragment_reversed = html[0:m.span()[0]][::-1]
+        title_start = fragment_reversed.find('"=eltit')
+        quotes_before = [i for i, c in enumerate(fragment_reversed[0:title_start]) if c == '"']
+        if title_start != -1 and len(quotes_before) == 0:
+            return w
+        if w.upper() in [k.upper() for k in R.entity_definitions.keys()] or w in R.pset_definitions or w in R.type_values:
+            return "<a href='" + url_for("resource", resource=case_norm(w)) + "'>" + w + "</a>"
+        else:
+            return w
+
+    html = ifcre.sub(decorate_link, html)
+    soup = BeautifulSoup(html)
+
+    for elem in soup.findAll("figure"):
+        if elem.figcaption:
+            if "\u2014" in elem.figcaption.text:
+                label, caption = map(str.strip, elem.figcaption.text.split("\u2014", 1))
+
+    title = soup.findAll("title")[0]
+    title.string = title_string
+
+    return str(soup)
+
+
+def measure(fn, html, repetitions):
+    timings = []
+    for i in range(repetitions):
+        t0 = time.perf_counter()
+        fn(html)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    try:
+        repetitions = int(sys.argv[1])
+    except:
+        repetitions = 5
+
+    pages = sys.argv[2:] or PAGES
+
+    # Redis listings are not of interest here
+    server.redis = None
+
+    results = []
+
+    for page in pages:
+        with app.test_request_context(server.make_url(page)):
+            server.before()
+            html = app.dispatch_request()
+
+            t_two_pass = measure(two_pass_postprocess, html, repetitions)
+            t_single_pass = measure(server.postprocess_html, html, repetitions)
+
+        results.append({
+            "page": page,
+            "bytes": len(html),
+            "two_pass_ms": round(t_two_pass * 1000., 1),
+            "single_pass_ms": round(t_single_pass * 1000., 1),
+            "speedup": round(t_two_pass / t_single_pass, 2),
+        })
+
+    import tabulate
+    print(tabulate.tabulate([r.values() for r in results], headers=results[0].keys()))
@@ -0,0 +1,73 @@
+"""
+Benchmark of loading an XMI file with xmi.doc (expat, single pass) compared
+to xmi.minidom_doc (the former minidom implementation) and to loading the
+snapshot written by xmi.load().
+
+Usage: python benchmark_xmi.py <schema.xml> [repetitions]
+
+Every load runs in a fresh process, so that the peak resident set size is
+that of the loader alone.
+"""
+
+import sys
+import time
+import resource
+import statistics
+import multiprocessing
+
+import xmi
+
+LOADERS = {
+    "minidom": xmi.minidom_doc,
+    "expat": xmi.doc,
+    "snapshot": xmi.load,
+}
+
+
+def load(loader, fn, queue):
+    t0 = time.perf_counter()
+    d = LOADERS[loader](fn)
+    t1 = time.perf_counter()
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((t1 - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., len(d.by_id)))
+
+
+def measure(loader, fn):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    p = ctx.Process(target=load, args=(loader, fn, queue))
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
+
+
+if __name__ == "__main__":
+    try:
+        fn = sys.argv[1]
+    except IndexError:
+        print("Usage: python benchmark_xmi.py <schema.xml> [repetitions]", file=sys.stderr)
+        exit(1)
+
+    try:
+        repetitions = int(sys.argv[2])
+    except:
+        repetitions = 3
+
+    # Make sure the snapshot exists, in a separate process because the peak
+    # resident set size is inherited by child processes
+    measure("snapshot", fn)
+
+    results = []
+
+    for loader in LOADERS:
+        timings, rss, elements = zip(*(measure(loader, fn) for i in range(repetitions)))
+        results.append({
+            "loader": loader,
+            "ids": elements[0],
+            "load_s": round(statistics.median(timings), 2),
+            "peak_rss_mb": round(max(rss), 1),
+        })
+
+    import tabulate
+    print(tabulate.tabulate([r.values() for r in results], headers=results[0].keys()))
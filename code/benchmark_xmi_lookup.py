@@ -0,0 +1,78 @@
+"""
+Benchmark of the child lookups with the `/` and `|` operators on xmi.doc
+elements, by iterating over all definitions of an xmi_document. The indexed
+lookup of xmi.element is compared to scanning the subtree of the element
+for every lookup (the former implementation).
+
+Usage: python benchmark_xmi_lookup.py <schema.xml> [repetitions]
+"""
+
+import sys
+import time
+import statistics
+
+import xmi
+from xmi_document import xmi_document
+
+METHODS = {
+    "scan": {
+        xmi.element: xmi.base.descendants_with_tag,
+        xmi.doc: xmi.base.descendants_with_tag,
+    },
+    "index": {
+        xmi.element: xmi.element.descendants_with_tag,
+        xmi.doc: xmi.doc.descendants_with_tag,
+    },
+}
+
+
+def iterate(document):
+    for e in document.xmi.elements():
+        e._index = None
+
+    calls = 0
+    lookup = xmi.element.descendants_with_tag
+
+    def counted(self, other):
+        nonlocal calls
+        calls += 1
+        return lookup(self, other)
+
+    xmi.element.descendants_with_tag = counted
+    try:
+        t0 = time.perf_counter()
+        n = sum(1 for _ in document)
+        return time.perf_counter() - t0, n, calls
+    finally:
+        xmi.element.descendants_with_tag = lookup
+
+
+if __name__ == "__main__":
+    try:
+        fn = sys.argv[1]
+    except IndexError:
+        print("Usage: python benchmark_xmi_lookup.py <schema.xml> [repetitions]", file=sys.stderr)
+        exit(1)
+
+    try:
+        repetitions = int(sys.argv[2])
+    except:
+        repetitions = 5
+
+    document = xmi_document(fn)
+
+    results = []
+
+    for method, functions in METHODS.items():
+        for cls, f in functions.items():
+            cls.descendants_with_tag = f
+        timings, definitions, lookups = zip(*(iterate(document) for i in range(repetitions)))
+        results.append({
+            "lookup": method,
+            "definitions": definitions[0],
+            "element_lookups": lookups[0],
+            "iterate_s": round(statistics.median(timings), 2),
+        })
+
+    import tabulate
+    print(tabulate.tabulate([r.values() for r in results], headers=results[0].keys()))
@@ -0,0 +1,444 @@
+"""
+Builds the resources of the documentation server from the schema and the
+documentation.
+
+Usage: python build.py [-j <processes>] [--force] [--since <commit>] [all | <stage>...]
+
+Every stage declares the files it reads and writes. A stage runs after the
+earlier stages that write its inputs (or that read or write its outputs) and
+independent stages run concurrently, each in its own process. The sha256 of
+the inputs of a stage, together with its commands and variables, is stored
+in build_state.json after it succeeds; a stage is skipped when this digest is
+unchanged and its outputs exist. When a stage reproduces identical outputs,
+the stages that depend on them are skipped as well.
+
+Without arguments the stages of create_resources.sh are run, `all` adds the
+stages that require the deployment environment (process_schema and search)
+and stage names select individual stages. --force runs stages regardless of
+their digest.
+
+With --since only the stages affected by the files changed since the given
+commit are considered, according to the inputs they declare, and only the
+changed Markdown documents are reindexed for search. Stages that failed, or
+did not run because a stage they depend on failed, are recorded in
+build_state.json and always considered until they succeed.
+
+After a successful build the files that the stages write to the code
+directory are published as a new generation in generations/, with a
+manifest, and generations/current is then pointed to it. With
+SERVE_GENERATIONS=1 the server reads from the current generation, so that it
+never sees files that are being written. The last KEEP_GENERATIONS (default 3) generations are kept, for
+requests that started before the switch.
+"""
+
+import os
+import sys
+import html
+import json
+import glob
+import time
+import fnmatch
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import tabulate
+
+from generation import GENERATIONS_DIR, CURRENT_GENERATION, current_generation, read_manifest
+
+CODE_DIR = os.path.abspath(os.path.dirname(__file__))
+REPO_DIR = os.path.abspath(os.environ.get("REPO_DIR", os.path.join(CODE_DIR, "..")))
+STATE_FN = os.path.join(CODE_DIR, "build_state.json")
+
+SOLR_DIR = os.environ.get("SOLR_DIR", "/solr-8.6.3")
+XML_PATH = "/tmp/ifc43-xml"
+
+KEEP_GENERATIONS = int(os.environ.get("KEEP_GENERATIONS", "3"))
+
+
+def file_hash(fn):
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def expand(path):
+    """
+    The files denoted by a path, which is a file, a directory (all files
+    below it) or a recursive glob pattern.
+    """
+    if glob.has_magic(path):
+        return sorted(fn for fn in glob.glob(path, recursive=True) if os.path.isfile(fn))
+    if os.path.isdir(path):
+        return sorted(os.path.join(d, fn) for d, _, fns in os.walk(path) for fn in fns)
+    return [path]
+
+
+def literal_prefix(path):
+    parts = path.split(os.sep)
+    for i, p in enumerate(parts):
+        if glob.has_magic(p):
+            return os.sep.join(parts[:i])
+    return path
+
+
+def matches(path, pattern):
+    # fnmatch wildcards match path separators, but **/ also matches no directory
+    return fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(path, pattern.replace("**" + os.sep, ""))
+
+
+def overlaps(a, b):
+    """
+    Whether two paths, directories or glob patterns can denote the same file.
+    """
+    pa, pb = literal_prefix(a), literal_prefix(b)
+    if not (pa == pb or pa.startswith(pb + os.sep) or pb.startswith(pa + os.sep)):
+        return False
+    if pa == a and pb != b:
+        return a == pb or pb.startswith(a + os.sep) or matches(a, b)
+    if pb == b and pa != a:
+        return b == pa or pa.startswith(b + os.sep) or matches(b, a)
+    return True
+
+
+class stage:
+    def __init__(self, name, commands, inputs=(), outputs=(), variables=None, cwd=None, requires=(), default=True):
+        """
+        A command is a list of arguments or a shell command string, paths are
+        relative to the code directory. The python scripts that are invoked
+        are inputs of the stage as well. Stages in requires run before this
+        stage without their outputs being inputs.
+        """
+        self.name = name
+        self.commands = commands
+        self.cwd = os.path.join(CODE_DIR, cwd) if cwd else CODE_DIR
+        self.inputs = [self.absolute(p) for p in inputs]
+        self.inputs += [self.absolute(a) for c in commands if not isinstance(c, str) for a in c if a.endswith(".py") and os.path.exists(self.absolute(a))]
+        self.outputs = [self.absolute(p) for p in outputs]
+        self.variables = variables or {}
+        self.requires = requires
+        self.default = default
+
+    def absolute(self, p):
+        return os.path.normpath(os.path.join(CODE_DIR, p))
+
+    def depends_on(self, other):
+        if other.name in self.requires:
+            return True
+        return any(overlaps(a, b) for a in self.inputs for b in other.outputs) or \
+            any(overlaps(a, b) for a in self.outputs for b in other.inputs + other.outputs)
+
+    def digest(self):
+        h = hashlib.sha256()
+        h.update(json.dumps([self.commands, self.variables], sort_keys=True).encode("utf-8"))
+        for fn in sorted(set(f for p in self.inputs for f in expand(p))):
+            h.update(os.path.relpath(fn, REPO_DIR).encode("utf-8") + b"\0")
+            try:
+                h.update(file_hash(fn).encode("ascii"))
+            except OSError:
+                h.update(b"-")
+        return h.hexdigest()
+
+    def outputs_exist(self):
+        return all(os.path.isfile(p) or (os.path.isdir(p) and os.listdir(p)) for p in self.outputs)
+
+    def execute(self, previous_digest, force):
+        t0 = time.time()
+        digest = self.digest()
+        if not force and digest == previous_digest and self.outputs_exist():
+            return "skipped", digest, time.time() - t0
+        print(f"[{self.name}] started", flush=True)
+        for c in self.commands:
+            if subprocess.call(c, cwd=self.cwd, shell=isinstance(c, str)) != 0:
+                return "failed", None, time.time() - t0
+        return "ran", digest, time.time() - t0
+
+
+def read_state(fn):
+    try:
+        with open(fn, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(fn, state):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fn), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, fn)
+
+
+def run(stages, processes=None, force=False, state_fn=STATE_FN):
+    """
+    Runs the stages, in the order of the list for stages that depend on each
+    other. Returns a list of (name, status, seconds), where status is one of
+    ran, skipped, failed or blocked (a stage it depends on failed). Failed
+    and blocked stages are listed in the state under "failed".
+    """
+    dependencies = {s.name: [t.name for t in stages[:i] if s.depends_on(t)] for i, s in enumerate(stages)}
+    state = read_state(state_fn)
+    failed = set(state.get("failed", ()))
+    results = {}
+    pending = list(stages)
+    running = {}
+
+    with ThreadPoolExecutor(processes or os.cpu_count()) as executor:
+        while pending or running:
+            for s in list(pending):
+                deps = dependencies[s.name]
+                if any(d not in results for d in deps):
+                    continue
+                pending.remove(s)
+                if any(results[d][0] in ("failed", "blocked") for d in deps):
+                    results[s.name] = "blocked", 0.
+                    failed.add(s.name)
+                    state["failed"] = sorted(failed)
+                    write_state(state_fn, state)
+                else:
+                    running[executor.submit(s.execute, state.get(s.name), force)] = s
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in done:
+                s = running.pop(f)
+                status, digest, seconds = f.result()
+                results[s.name] = status, seconds
+                if status != "skipped":
+                    print(f"[{s.name}] {status} in {seconds:.1f}s", flush=True)
+                if status == "failed":
+                    failed.add(s.name)
+                else:
+                    failed.discard(s.name)
+                if status == "ran":
+                    state[s.name] = digest
+                state["failed"] = sorted(failed)
+                write_state(state_fn, state)
+
+    return [(s.name, *results[s.name]) for s in stages]
+
+
+def report(results, t0):
+    print(tabulate.tabulate(results, headers=("stage", "status", "seconds"), floatfmt=".1f"))
+    print(f"Total {time.time() - t0:.1f}s")
+
+
+def published_files(stages):
+    """
+    The outputs of the stages that are files in the code directory.
+    """
+    return sorted(set(os.path.basename(p) for s in stages for p in s.outputs if os.path.dirname(p) == CODE_DIR and os.path.isfile(p)))
+
+
+def publish(names):
+    """
+    Copies the files from the code directory into a new generation and makes
+    it the current one. Files that are unchanged since the current generation
+    are hard links to it. Returns the name of the new generation.
+    """
+    previous = current_generation()
+    previous_files = read_manifest(previous)
+
+    generation = time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+    directory = os.path.join(GENERATIONS_DIR, generation)
+    os.makedirs(directory)
+
+    files = {}
+    for fn in names:
+        src, dst = os.path.join(CODE_DIR, fn), os.path.join(directory, fn)
+        files[fn] = file_hash(src)
+        if previous_files.get(fn) == files[fn]:
+            try:
+                os.link(os.path.join(GENERATIONS_DIR, previous, fn), dst)
+                continue
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
+
+    write_state(os.path.join(directory, "manifest.json"), {"files": files, "created": time.time()})
+
+    # Replacing a symlink with rename() is atomic
+    link = CURRENT_GENERATION + ".tmp"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(generation, link)
+    os.replace(link, CURRENT_GENERATION)
+
+    generations = sorted(d for d in os.listdir(GENERATIONS_DIR) if d not in (generation, "current") and os.path.isdir(os.path.join(GENERATIONS_DIR, d)))
+    for d in generations[:max(0, len(generations) - KEEP_GENERATIONS + 1)]:
+        shutil.rmtree(os.path.join(GENERATIONS_DIR, d), ignore_errors=True)
+
+    return generation
+
+
+def repo(*args):
+    return os.path.join(REPO_DIR, *args)
+
+
+def changed_paths(since):
+    """
+    The absolute paths of the files that differ between a commit and HEAD,
+    or None when the commit is unknown (e.g. after a force push).
+    """
+    try:
+        names = subprocess.check_output(["git", "-C", REPO_DIR, "diff", "--name-only", since, "HEAD"], stderr=subprocess.DEVNULL).decode("utf-8")
+    except subprocess.CalledProcessError:
+        return None
+    return [os.path.normpath(repo(n)) for n in names.splitlines() if n]
+
+
+def affected(stages, paths, failed=()):
+    """
+    The stages that read one of the paths or the outputs of another affected
+    stage. Stages with variables are included as well, because these are not
+    reflected in the paths, their digest determines whether they run, and so
+    are the stages that failed in an earlier build.
+    """
+    result = []
+    for s in stages:
+        if s.variables or s.name in failed or \
+            any(overlaps(a, p) for a in s.inputs for p in paths) or \
+            any(overlaps(a, b) for a in s.inputs for t in result for b in t.outputs):
+            result.append(s)
+    return result
+
+
+def search_commands(changed=None):
+    """
+    Transforms the documentation to Solr documents and posts them. When the
+    changed paths are known only the changed Markdown files are reposted and
+    the removed ones are deleted from the index.
+    """
+    py = sys.executable
+    post = f"{SOLR_DIR}/bin/post"
+
+    if changed is None:
+        return [
+            [py, "transform_to_xml.py", repo("docs"), XML_PATH],
+            # fails when the core already exists
+            f"{SOLR_DIR}/bin/solr create_core -force -c ifc || true",
+            [post, "-c", "ifc", XML_PATH],
+        ]
+
+    md = [p for p in changed if p.endswith(".md") and p.startswith(repo("docs") + os.sep)]
+    updated = [p for p in md if os.path.exists(p)]
+    removed = [p for p in md if not os.path.exists(p)]
+    xml = lambda p: os.path.join(XML_PATH, os.path.basename(p)[:-3] + ".xml")
+
+    commands = []
+    if updated:
+        commands.append([py, "transform_to_xml.py", repo("docs"), XML_PATH, *updated])
+        commands.append([post, "-c", "ifc", *map(xml, updated)])
+    if removed:
+        ids = "".join(f"<id>{html.escape(os.path.basename(p)[:-3])}</id>" for p in removed)
+        commands.append([post, "-c", "ifc", "-d", f"<delete>{ids}</delete>"])
+        commands.append(["rm", "-f", *map(xml, removed)])
+    return commands
+
+
+def create_stages(changed=None):
+    # Not imported at module level, the schema name includes the current commit
+    from xmi_document import SCHEMA_NAME, is_iso
+
+    py = sys.executable
+    ifc_xml = repo("schemas", "IFC.xml")
+    docs = [repo("docs", "schemas", "**", "*.md"), repo("docs", "properties", "**", "*.md")]
+    # The documentation is only read by the scripts that use the (lazy)
+    # markdown properties of xmi_document
+    xmi_inputs = [ifc_xml, "xmi.py", "xmi_document.py"]
+    resources = [
+        "entity_supertype.json", "entity_to_package.json", "hierarchy.json", "entity_attributes.json",
+        "entity_definitions.json", "pset_definitions.json", "deprecated_entities.json", "abstract_entities.json",
+        "type_values.json", "entity_where_clauses.json", "entity_references.json", "inheritance_listing.txt",
+    ]
+    xmi = ("xmi_snapshot",)
+    concepts = ["xmi_concepts.json", "xmi_concepts_by_entity.json", "xmi_mvd_concepts.json"]
+
+    return [
+        # Parse the XMI once, the other scripts load the snapshot
+        stage("xmi_snapshot", [[py, "xmi.py", ifc_xml]], inputs=[ifc_xml]),
+        stage("extract_concepts", [[py, "extract_concepts_from_xmi.py", ifc_xml]],
+            inputs=xmi_inputs + [repo("docs", "templates", "**", "*.md"), repo("schemas", "mvd.csv"), "concept_extractor.py", "concept_interpretation.py"],
+            outputs=concepts, requires=xmi),
+        stage("to_pset", [[py, "to_pset.py", ifc_xml, "psd/"]], inputs=xmi_inputs + docs, outputs=["psd"], requires=xmi),
+        stage("psd_zip", ["zip ../psd.zip *"], cwd="psd", inputs=["psd"], outputs=["psd.zip"]),
+        stage("parse_xmi", [[py, "parse_xmi.py", ifc_xml]], inputs=xmi_inputs + ["psd"], outputs=resources,
+            variables={"SCHEMA_NAME": SCHEMA_NAME}, requires=xmi),
+        stage("to_express", [[py, "to_express.py", ifc_xml, "IFC.exp"]], inputs=xmi_inputs, outputs=["IFC.exp"],
+            variables={"SCHEMA_NAME": SCHEMA_NAME}, requires=xmi),
+        stage("express_to_xsd", [[py, "express_to_xsd.py", "IFC.exp", "IFC.xsd"]], inputs=["IFC.exp", "xml_dict.py"], outputs=["IFC.xsd"],
+            variables={"SCHEMA_NAME": SCHEMA_NAME}),
+        stage("change_log", [[py, "change_log.py", REPO_DIR]],
+            inputs=["IFC.exp", "deprecated_entities.json", "psd", repo("reference_schemas"), docs[0]],
+            outputs=["changes_by_schema.json", "changes_by_type.json"],
+            variables={"ISO": is_iso}),
+        stage("parse_examples", [[py, "parse_examples.py", REPO_DIR]],
+            inputs=[repo("..", "examples", "models", "**", "*.ifc")], outputs=["examples_by_type.json"]),
+        stage("templates_to_mvdxml", [[py, "templates_to_mvdxml.py", "IFC4.3.mvdxml", REPO_DIR]],
+            inputs=[repo("content", "scope.md"), repo("docs", "**", "*.md"), "entity_supertype.json", "xmi_concepts.json"],
+            outputs=["IFC4.3.mvdxml"],
+            variables={"SCHEMA_NAME": SCHEMA_NAME}),
+        stage("determine_mvd_scope", [[py, "determine_mvd_scope.py", "IFC.exp", "IFC4.3.mvdxml"]],
+            inputs=["IFC.exp", "IFC4.3.mvdxml", "xmi_mvd_concepts.json", "xmi_concepts.json"],
+            outputs=["mvd_entity_usage.json"]),
+        stage("process_schema", [[py, "process_schema.py", ifc_xml]], inputs=xmi_inputs,
+            outputs=[repo("output", "IFC.xml")], requires=xmi, default=False),
+        stage("render_diagrams", [[py, "render_diagrams.py"]],
+            inputs=[docs[0], repo("docs", "templates", "**", "README.md"), "server.py", "graphviz_cache.py"] + resources + concepts,
+            outputs=[os.path.join("svgs", "manifest.json")]),
+        stage("search", search_commands(changed), inputs=[repo("docs", "**", "*.md")], outputs=[XML_PATH], default=False),
+    ]
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    processes = os.cpu_count()
+    force = False
+
+    if "-j" in args:
+        i = args.index("-j")
+        processes = int(args[i + 1])
+        args[i:i + 2] = []
+    if "--force" in args:
+        args.remove("--force")
+        force = True
+    if "--since" in args:
+        i = args.index("--since")
+        changed = changed_paths(args[i + 1])
+        args[i:i + 2] = []
+    else:
+        changed = None
+
+    stages = all_stages = create_stages(changed)
+    names = [s.name for s in stages]
+
+    if args == ["all"]:
+        pass
+    elif args:
+        unknown = set(args) - set(names)
+        if unknown:
+            print(f"Unknown stages: {', '.join(sorted(unknown))}, available: {', '.join(names)}", file=sys.stderr)
+            exit(1)
+        stages = [s for s in stages if s.name in args]
+    else:
+        stages = [s for s in stages if s.default]
+
+    if changed is not None:
+        stages = affected(stages, changed, read_state(STATE_FN).get("failed", ()))
+
+    t0 = time.time()
+    results = run(stages, processes, force)
+    report(results, t0)
+
+    if any(st in ("failed", "blocked") for _, st, _ in results):
+        exit(1)
+
+    if any(st == "ran" for _, st, _ in results) or current_generation() is None:
+        print("Published generation", publish(published_files(all_stages)))
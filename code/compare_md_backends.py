@@ -0,0 +1,149 @@
+"""
+Compares the section trees of md.parse_data with the python-markdown and
+BeautifulSoup backend (parse_html) to those built from the markdown-it-py
+token stream (parse_tokens) for all Markdown documents, and times both.
+
+Usage: python compare_md_backends.py [docs directory] [--html] [-v] [--update]
+
+Headings, levels and nesting need to be identical. Content is compared
+as text, or with --html as markup after normalizing it with BeautifulSoup
+and collapsing whitespace, because both libraries serialize attributes,
+void elements and line breaks differently. Remaining differences are
+mostly where python-markdown and CommonMark disagree, e.g. on lists that
+are not preceded by a blank line and on backslash escapes.
+
+The documents with such known differences in content are listed in
+md_backend_divergences.txt, per comparison mode. The exit status is 1 when
+a section tree differs or the content of a document that is not listed
+differs. --update rewrites the list for the mode from the current results.
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import itertools
+
+import bs4
+
+import md
+
+DIVERGENCES_FN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "md_backend_divergences.txt")
+
+def sections(root):
+    yield root
+    for c in root.children if root else ():
+        yield from sections(c)
+
+
+def normalize(html):
+    soup = md.BeautifulSoup(html)
+    # parse_html() serializes top-level comments as their text
+    for c in soup.find_all(string=lambda s: isinstance(s, bs4.Comment)):
+        c.replace_with(str(c))
+    return re.sub(r"\s+", " ", str(soup.body or "")).replace("> <", "><")
+
+
+def compare(a, b, as_text):
+    for x, y in itertools.zip_longest(sections(a), sections(b)):
+        if x is None or y is None:
+            return "structure"
+        if (x.level, x.heading, len(x.children)) != (y.level, y.heading, len(y.children)):
+            return "structure"
+        if as_text:
+            if x.content != y.content:
+                return "content"
+        elif x.content != y.content and normalize(x.content) != normalize(y.content):
+            return "content"
+    return "identical"
+
+
+def read_divergences():
+    """
+    The set of (mode, document) listed as known content differences
+    """
+    try:
+        with open(DIVERGENCES_FN, encoding="utf-8") as f:
+            return set(tuple(l.split(" ", 1)) for l in f.read().splitlines() if l and not l.startswith("#"))
+    except FileNotFoundError:
+        return set()
+
+
+def write_divergences(divergences):
+    with open(DIVERGENCES_FN, "w", encoding="utf-8") as f:
+        f.write("# Documents for which the content of the python-markdown and markdown-it\n")
+        f.write("# backends of md.py differs, see compare_md_backends.py\n")
+        for mode, fn in sorted(divergences):
+            f.write(f"{mode} {fn}\n")
+
+
+def timed(f, data, as_text):
+    t0 = time.perf_counter()
+    root = f(data, "", as_text)
+    t1 = time.perf_counter()
+    for s in sections(root):
+        if s:
+            s.content
+    return root, t1 - t0, time.perf_counter() - t1
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("-")]
+    as_text = "--html" not in sys.argv
+    verbose = "-v" in sys.argv
+    mode = "text" if as_text else "html"
+
+    docs = args[0] if args else os.path.join(os.path.dirname(__file__), "..", "docs")
+    fns = sorted(glob.glob(os.path.join(docs, "**", "*.md"), recursive=True))
+
+    md.markdown_it()
+
+    counts = {}
+    differing = set()
+    timings = {"python-markdown": [0., 0.], "markdown-it": [0., 0.]}
+
+    for fn in fns:
+        with open(fn, encoding="utf-8") as f:
+            data = f.read()
+        if not data:
+            continue
+        roots = []
+        for backend, f in (("python-markdown", md.parse_html), ("markdown-it", md.parse_tokens)):
+            root, parse_s, content_s = timed(f, data, as_text)
+            timings[backend][0] += parse_s
+            timings[backend][1] += content_s
+            roots.append(root)
+        result = compare(*roots, as_text)
+        counts[result] = counts.get(result, 0) + 1
+        name = os.path.relpath(fn, docs).replace("\\", "/")
+        if result != "identical":
+            differing.add((result, name))
+        if verbose and result != "identical":
+            print(result, name)
+
+    import tabulate
+    print(tabulate.tabulate(counts.items(), headers=("", "documents")))
+    print()
+    print(tabulate.tabulate([(k, *v, sum(v)) for k, v in timings.items()], headers=("backend", "parse_s", "content_s", "total_s"), floatfmt=".1f"))
+
+    known = read_divergences()
+    content = set((mode, name) for result, name in differing if result == "content")
+
+    if "--update" in sys.argv:
+        write_divergences(set(k for k in known if k[0] != mode) | content)
+        print(f"Listed {len(content)} documents in {os.path.basename(DIVERGENCES_FN)}")
+        known = read_divergences()
+
+    print()
+    failures = sorted(name for result, name in differing if result == "structure")
+    for name in failures:
+        print("Section tree differs:", name)
+    new = sorted(name for m, name in content - known)
+    for name in new:
+        print("Content differs, not listed as known:", name)
+    for name in sorted(name for m, name in known - content if m == mode):
+        print("Listed as known, but no longer differs:", name)
+
+    if failures or new:
+        exit(1)
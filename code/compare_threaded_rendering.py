@@ -0,0 +1,70 @@
+"""
+Renders pages concurrently from several threads and compares them to the
+same pages rendered one at a time, to check that the section and figure
+numbering and the navigation do not leak between requests, so that the
+server can run with threaded workers (e.g. gunicorn --threads).
+
+Usage: python compare_threaded_rendering.py [threads] [page ...]
+
+Pages are paths relative to the documentation base url. Needs the generated
+schema resources in the working directory, like server.py.
+"""
+
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from server import app
+
+PAGES = [
+    "lexical/IfcWall.htm",
+    "lexical/IfcBuildingElementProxy.htm",
+    "lexical/Pset_WallCommon.htm",
+    "content/terms_and_definitions.htm",
+    "chapter-5/",
+    "annex-b1.html",
+    "toc.html",
+]
+
+
+def render(client, page):
+    response = client.get(server.make_url(page))
+    return response.status_code, response.get_data()
+
+
+if __name__ == "__main__":
+    try:
+        threads = int(sys.argv[1])
+    except:
+        threads = 8
+
+    pages = sys.argv[2:] or PAGES
+
+    # Rendering needs to happen every time
+    server.page_cache = None
+    server.redis = None
+
+    client = app.test_client()
+    expected = {page: render(client, page) for page in pages}
+
+    # Every thread renders all pages, starting at a different page
+    jobs = [pages[i % len(pages):] + pages[:i % len(pages)] for i in range(threads * 4)]
+
+    def run(job):
+        client = app.test_client()
+        return [(page, render(client, page)) for page in job]
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = [r for rs in executor.map(run, jobs) for r in rs]
+    seconds = time.perf_counter() - t0
+
+    differences = sorted(set(page for page, result in results if result != expected[page]))
+    for page in differences:
+        print("Differs when rendered concurrently:", page)
+    print(f"{len(results)} pages in {seconds:.1f}s using {threads} threads, {len(differences)} differ")
+
+    if differences:
+        exit(1)
@@ -364,6 +364,21 @@ if __name__ == "__main__":
 
     json.dump(result, open("xmi_concepts.json", "w", encoding="utf-8"), indent=1)
 
+    # The same rows grouped by ApplicableEntity, so that the concepts of an
+    # entity and its supertypes can be looked up directly. The position of
+    # the first row of an entity within the concept is retained to determine
+    # which of the supertypes a concept is inherited from.
+    result_by_entity = {}
+    for view_name, concepts in result.items():
+        for concept_name, rows in concepts.items():
+            for position, row in enumerate(rows):
+                if row.get("ApplicableEntity"):
+                    result_by_entity.setdefault(row["ApplicableEntity"], {}).setdefault(view_name, {}).setdefault(
+                        concept_name, {"position": position, "rows": []}
+                    )["rows"].append(row)
+
+    json.dump(result_by_entity, open("xmi_concepts_by_entity.json", "w", encoding="utf-8"), indent=1)
+
     """
     xmi_mvd_concepts = {}
     views = {p.name: p for p in xmi_doc.xmi.by_tag_and_type["packagedElement"]["uml:Package"]}['Views']
@@ -0,0 +1,40 @@
+"""
+The generations of build outputs that build.py publishes in generations/,
+each a directory with a manifest.json of the sha256 of its files, and
+generations/current, a symlink to the one published last.
+"""
+
+import os
+import json
+
+CODE_DIR = os.path.abspath(os.path.dirname(__file__))
+GENERATIONS_DIR = os.path.join(CODE_DIR, "generations")
+CURRENT_GENERATION = os.path.join(GENERATIONS_DIR, "current")
+
+
+def current_generation():
+    try:
+        return os.readlink(CURRENT_GENERATION)
+    except OSError:
+        return None
+
+
+def read_manifest(generation):
+    """
+    The sha256 of the files in a generation by name, empty when there is no
+    such generation.
+    """
+    if generation is None:
+        return {}
+    try:
+        with open(os.path.join(GENERATIONS_DIR, generation, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def generation_files(generation):
+    """
+    The paths of the files in a generation by name.
+    """
+    return {fn: os.path.join(GENERATIONS_DIR, generation, fn) for fn in read_manifest(generation)}
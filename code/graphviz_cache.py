@@ -0,0 +1,167 @@
+"""
+Content-addressed cache of diagrams rendered by Graphviz.
+
+A diagram is identified by the hash of its final dot source together with
+the Graphviz arguments, so an existing SVG can be reused without invoking
+dot. Missing diagrams are rendered concurrently by a bounded number of dot
+processes and the least recently used diagrams are removed when the
+directory exceeds its size limit, except for the diagrams listed in
+manifest.json, which are rendered ahead of time by render_diagrams.py, and
+the diagrams used in the last GRACE_SECONDS, which other workers may be
+about to read.
+
+    cache = svg_cache("svgs", max_bytes, max_workers)
+    keys = [cache.submit(name, dot_source, args) for ...]
+    cache.wait(keys)
+    svgs = [cache.read(key) for key in keys]
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+GRACE_SECONDS = 60
+
+
+class svg_cache:
+    def __init__(self, directory, max_bytes, max_workers, max_sources=256):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.executor = None
+        self.pending = {}
+        # The sources of the last submitted diagrams, to render them again
+        # when they are evicted by another worker before they are read
+        self.sources = OrderedDict()
+        self.max_sources = max_sources
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+    def key(self, name, source, args):
+        h = hashlib.sha256("\0".join(list(args) + [source]).encode("utf-8")).hexdigest()
+        return name + "_" + h
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".dot.svg")
+
+    def pinned(self):
+        try:
+            with open(os.path.join(self.directory, "manifest.json"), encoding="utf-8") as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def submit(self, name, source, args=()):
+        """
+        Returns the key of the diagram, which is rendered in the background
+        unless it is already available.
+        """
+        key = self.key(name, source, args)
+        with self.lock:
+            self.sources[key] = source, list(args)
+            self.sources.move_to_end(key)
+            while len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+            return self.schedule(key, source, args)
+
+    def schedule(self, key, source, args):
+        # called with the lock held
+        if key in self.pending:
+            return key
+        try:
+            # The modification time is used as the access time for eviction
+            os.utime(self.path(key))
+            return key
+        except FileNotFoundError:
+            pass
+        if self.executor is None:
+            # Created lazily so that no threads exist before gunicorn forks its workers
+            self.executor = ThreadPoolExecutor(self.max_workers)
+        self.pending[key] = self.executor.submit(self.render, key, source, list(args))
+        return key
+
+    def wait(self, keys):
+        for key in keys:
+            with self.lock:
+                future = self.pending.get(key)
+            if future is not None:
+                try:
+                    future.result()
+                finally:
+                    with self.lock:
+                        self.pending.pop(key, None)
+
+    def read(self, key):
+        """
+        The SVG of a submitted diagram. When it was removed by another worker
+        in the meantime it is rendered again.
+        """
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            with self.lock:
+                if key not in self.sources:
+                    raise
+                self.schedule(key, *self.sources[key])
+        self.wait([key])
+        with open(self.path(key), encoding="utf-8") as f:
+            return f.read()
+
+    def render(self, key, source, args):
+        # The source is passed on stdin and the SVG is rendered to a temporary
+        # file first, so that concurrent renders of the same diagram in other
+        # workers never read or publish a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            if subprocess.run([shutil.which("dot") or "dot", *args, "-Tsvg", "-o", tmp], input=source.encode("utf-8")).returncode == 0:
+                os.replace(tmp, self.path(key))
+                with self.lock:
+                    self.size += os.path.getsize(self.path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        pinned = self.pinned()
+        recent = time.time() - GRACE_SECONDS
+        with self.lock:
+            entries = []
+            for e in os.scandir(self.directory):
+                if not e.name.endswith(".dot.svg") or e.name[:-8] in self.pending or e.name[:-8] in pinned:
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    # removed by another worker
+                    continue
+                try:
+                    # .dot files written by earlier versions
+                    size = st.st_size + os.path.getsize(e.path[:-4])
+                except FileNotFoundError:
+                    size = st.st_size
+                entries.append((st.st_mtime, size, e.path))
+            entries.sort()
+            self.size = sum(e[1] for e in entries)
+            target = self.max_bytes * 0.9
+            for mtime, size, fn in entries:
+                if self.size <= target or mtime > recent:
+                    break
+                for p in (fn, fn[:-4]):
+                    try:
+                        os.unlink(p)
+                    except FileNotFoundError:
+                        pass
+                self.size -= size
@@ -0,0 +1,28 @@
+"""
+With PRELOAD_RESOURCES=1 the application and its schema resources are loaded
+in the gunicorn master process before the workers are forked, so that the
+workers share them copy-on-write instead of each loading a copy. SIGHUP, sent
+by poller.py after a build, reloads the resources and restarts the workers.
+"""
+
+import gc
+import os
+
+preload_app = os.environ.get("PRELOAD_RESOURCES") == "1"
+
+
+def preload(arbiter):
+    if not preload_app:
+        return
+
+    import server
+
+    server.preload()
+
+    # Objects in the permanent generation are not inspected by the garbage
+    # collector, which would otherwise touch and thereby copy their pages
+    gc.freeze()
+
+
+when_ready = preload
+on_reload = preload
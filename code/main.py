@@ -1,84 +1,70 @@
 import os
 import sys
 import glob
-import subprocess
+import time
+
+import build
+from build import stage
 
 def relative_path(*args):
     return os.path.abspath(os.path.join(os.path.dirname(__file__), *args))
 
 reference_dir = relative_path("..", "reference_schemas")
-scripts = "to_express", "to_bsdd", "to_pset"
-# extensions = "exp",  "json", None
-extensions = "exp",  None, None
+references = ["IFC4x3_RC4.exp", "IFC4x3_RC4_43c3555.exp"]
 
 # check PO file for non-unique keys with
 # grep msgid ifc.pot | sort | uniq -d
 
-for ffn in glob.glob(relative_path("..", "schemas", "*.xml")):
+py = sys.executable
+docs = [relative_path("..", "docs", "schemas", "**", "*.md"), relative_path("..", "docs", "properties", "**", "*.md")]
+stages = []
+
+os.makedirs(relative_path("..", "output", "psd"), exist_ok=True)
+
+for ffn in sorted(glob.glob(relative_path("..", "schemas", "*.xml"))):
     fn = os.path.basename(ffn)
-    print("Processing:", fn)
-    
-    if not os.path.exists(relative_path("..", "output", "psd")):
-        os.makedirs(relative_path("..", "output", "psd"))
-    
-    for script, ext in zip(scripts, extensions):
-        print("Running:", script)
-        
-        if ext is None:
-            if script == "to_pset":
-                output_path = relative_path("..", "output", "psd")
-            else:
-                output_path = relative_path("..", "output")
-        else:
-            output_path = relative_path("..", "output", fn[:-4] + "." + ext)
-        
-        subprocess.check_call([
-            sys.executable, 
-            relative_path(script + ".py"), 
-            ffn, 
-            output_path
-        ])
-        if script == "to_express":
-        
-            for reference in ["IFC4x3_RC4.exp", "IFC4x3_RC4_43c3555.exp"]:
-        
-                subprocess.check_call([
-                    sys.executable, 
-                    "-m", "express_diff", 
-                    os.path.join(reference_dir, reference),
-                    relative_path("..", "output", fn[:-4] + "." + ext),
-                    relative_path("..", "output", "%s-%s-differences.md" % (fn[:-4], reference[:-4]))
-                ], cwd=relative_path("."))
-                
-            subprocess.check_call([
-                sys.executable, 
-                "express_to_xsd.py",
-                output_path,
-                output_path.replace("exp", "xsd")
-            ], cwd=relative_path("."))
-            
-        elif script == "to_bsdd":
-        
-            subprocess.check_call([
-                sys.executable, 
-                relative_path("validate_bsdd.py"),
-                relative_path("..", "output", fn[:-4] + ".json")
-            ])
-            
-        elif script == "to_pset":
-            
-            subprocess.check_call([
-                sys.executable, 
-                relative_path(script + ".py"), 
-                "--compare",
-                output_path,
-                os.path.join(reference_dir, "psd"),
-                relative_path("..", "output", fn[:-4] + "-psets.md")
-            ])
-            
-    subprocess.check_call([sys.executable, relative_path("parse_xmi.py"), ffn], cwd=relative_path('.'))
-    subprocess.check_call([sys.executable, relative_path("extract_concepts_from_xmi.py"), ffn], cwd=relative_path('.'))
-    
-    subprocess.check_call([sys.executable, relative_path("templates_to_mvdxml.py"), relative_path("..", "output", "IFC4.3.mvdxml")], cwd=relative_path('.'))
+    exp = relative_path("..", "output", fn[:-4] + ".exp")
+    bsdd = relative_path("..", "output", fn[:-4] + ".json")
+    psd = relative_path("..", "output", "psd")
+    # The documentation is only read by the scripts that use the (lazy)
+    # markdown properties of xmi_document
+    xmi_inputs = [ffn, "xmi.py", "xmi_document.py"]
+    snapshot = (f"{fn}:xmi_snapshot",)
+
+    stages.append(stage(snapshot[0], [[py, relative_path("xmi.py"), ffn]], inputs=[ffn]))
+    stages.append(stage(f"{fn}:to_express", [[py, relative_path("to_express.py"), ffn, exp]], inputs=xmi_inputs, outputs=[exp], requires=snapshot))
+    for reference in references:
+        differences = relative_path("..", "output", "%s-%s-differences.md" % (fn[:-4], reference[:-4]))
+        stages.append(stage(f"{fn}:express_diff:{reference[:-4]}", [[py, "-m", "express_diff", os.path.join(reference_dir, reference), exp, differences]],
+            inputs=[os.path.join(reference_dir, reference), exp, "express_diff"], outputs=[differences]))
+    stages.append(stage(f"{fn}:express_to_xsd", [[py, "express_to_xsd.py", exp, exp[:-4] + ".xsd"]], inputs=[exp, "xml_dict.py"], outputs=[exp[:-4] + ".xsd"]))
+
+    stages.append(stage(f"{fn}:to_bsdd", [[py, relative_path("to_bsdd.py"), ffn, relative_path("..", "output")]],
+        inputs=xmi_inputs + docs + ["bsdd_excluded_entites.json"], outputs=[bsdd, relative_path("..", "output", "pot")], requires=snapshot))
+    stages.append(stage(f"{fn}:validate_bsdd", [[py, relative_path("validate_bsdd.py"), bsdd]], inputs=[bsdd]))
+
+    psets = relative_path("..", "output", fn[:-4] + "-psets.md")
+    stages.append(stage(f"{fn}:to_pset", [[py, relative_path("to_pset.py"), ffn, psd]], inputs=xmi_inputs + docs, outputs=[psd], requires=snapshot))
+    stages.append(stage(f"{fn}:compare_psets", [[py, relative_path("to_pset.py"), "--compare", psd, os.path.join(reference_dir, "psd"), psets]],
+        inputs=[psd, os.path.join(reference_dir, "psd")], outputs=[psets]))
+
+    stages.append(stage(f"{fn}:parse_xmi", [[py, relative_path("parse_xmi.py"), ffn]], inputs=xmi_inputs + ["psd"],
+        outputs=["entity_supertype.json", "entity_to_package.json", "hierarchy.json", "entity_attributes.json",
+            "entity_definitions.json", "pset_definitions.json", "deprecated_entities.json", "abstract_entities.json",
+            "type_values.json", "entity_where_clauses.json", "entity_references.json", "inheritance_listing.txt"], requires=snapshot))
+    stages.append(stage(f"{fn}:extract_concepts", [[py, relative_path("extract_concepts_from_xmi.py"), ffn]],
+        inputs=xmi_inputs + [relative_path("..", "docs", "templates", "**", "*.md"), os.path.join(os.path.dirname(ffn), "mvd.csv")],
+        outputs=["xmi_concepts.json", "xmi_concepts_by_entity.json", "xmi_mvd_concepts.json"], requires=snapshot))
+    stages.append(stage(f"{fn}:templates_to_mvdxml", [[py, relative_path("templates_to_mvdxml.py"), relative_path("..", "output", "IFC4.3.mvdxml")]],
+        inputs=[relative_path("..", "content", "scope.md"), relative_path("..", "docs", "**", "*.md"), "entity_supertype.json", "xmi_concepts.json"],
+        outputs=[relative_path("..", "output", "IFC4.3.mvdxml")]))
+
+stages.append(stage("generate_pset_templates", [[py, relative_path("generate_pset_templates.py"), relative_path("..", "output", "Pset_IFC4X3.ifc")]],
+    inputs=[relative_path("..", "output", "psd")], outputs=[relative_path("..", "output", "Pset_IFC4X3.ifc")]))
+
+t0 = time.time()
+results = build.run(stages, state_fn=relative_path("..", "output", "build_state.json"))
+build.report(results, t0)
 
-subprocess.check_call([sys.executable, relative_path("generate_pset_templates.py"), relative_path("..", "output", "Pset_IFC4X3.ifc")], cwd=relative_path('.'))
+if any(st in ("failed", "blocked") for _, st, _ in results):
+    exit(1)
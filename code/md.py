@@ -1,8 +1,13 @@
 import os
 import re
+import sys
+import atexit
 
+import functools
 import itertools
 
+from html import unescape
+
 from dataclasses import dataclass, field
 
 import markdown
@@ -19,50 +24,52 @@ class markdown_section:
     first_node_content : str
     children : list = field(default_factory=list)
     
+# Number of parsed files kept per process, MD_CACHE_STATS=1 prints the hit rate on exit
+MD_CACHE_SIZE = int(os.environ.get("MD_CACHE_SIZE", "1024"))
+
+# MD_BACKEND=markdown-it builds the section tree from the markdown-it-py token
+# stream instead of from the HTML rendered by python-markdown
+MD_BACKEND = os.environ.get("MD_BACKEND", "markdown")
+
+
 def parse_document(*, fn=None, data=None, linesep="", as_text=True):
+    """
+    Parses Markdown into a tree of sections by heading. Files are parsed once
+    per modification time, the returned tree is shared and should not be
+    modified.
+    """
     if fn:
-        data = open(fn, encoding="utf-8").read()
+        fn = os.path.abspath(fn)
+        return parse_file(fn, os.stat(fn).st_mtime_ns, linesep, as_text)
     else:
         assert data
+        return parse_data(data, linesep, as_text)
 
-    soup = BeautifulSoup(
-        markdown.markdown(data,
-        extensions=['tables', 'fenced_code', 'sane_lists'])
-    )
 
-    if not soup.h1:
-        # In a recent PR most of the top-level headings were removed
-        # from the Markdown documents, but the code here still relies
-        # on them for building the document tree, because parsing
-        # happens based on the various headings and their number.
-        if soup.body is None:
-            return markdown_section(1, '', '', '', [])
-        first = next(soup.body.children)
-        first.insert_before(soup.new_tag('h1', 'DocumentRoot'))
+@functools.lru_cache(maxsize=MD_CACHE_SIZE)
+def parse_file(fn, mtime, linesep, as_text):
+    return parse_data(open(fn, encoding="utf-8").read(), linesep, as_text, fn=fn)
 
-    
-    headings = soup.find_all(re.compile("h\d"))
-    next_heading = headings[1:] + [None]
-    
+
+if os.environ.get("MD_CACHE_STATS") == "1":
+    atexit.register(lambda: print("Markdown cache:", parse_file.cache_info(), file=sys.stderr))
+
+
+def parse_data(data, linesep, as_text, fn=None):
+    if MD_BACKEND == "markdown-it":
+        return parse_tokens(data, linesep, as_text, fn=fn)
+    else:
+        return parse_html(data, linesep, as_text, fn=fn)
+
+
+def section_tree(sections, fn=None):
+    """
+    Nests sections in document order by heading level, returns the first.
+    """
     root = None
     stack = [None]
 
-    for h, next_h in zip(headings, next_heading):
-        nodes = (n for n in h.nextSiblingGenerator())
-        selected = itertools.takewhile(lambda n: next_h is None or n != next_h, nodes)
-        concat = ""
-        first = ""
-        if as_text:
-            strings = list(filter(None, map(lambda n: getattr(n, 'text', '').strip(), selected)))
-            concat = linesep.join(strings)
-            first = strings[0] if strings else ""
-        else:
-            selected = list(selected)
-            if selected:
-                concat = "".join(map(str, selected))
-                first = str(selected[0])
-        
-        section = markdown_section(int(h.name[1:]), h.text, concat, first)
+    for section in sections:
         if section.level == len(stack):
             stack.append(None)
         elif section.level == len(stack) - 1:
@@ -83,11 +90,154 @@ def parse_document(*, fn=None, data=None, linesep="", as_text=True):
             
     return root
 
+
+def parse_html(data, linesep, as_text, fn=None):
+    soup = BeautifulSoup(
+        markdown.markdown(data,
+        extensions=['tables', 'fenced_code', 'sane_lists'])
+    )
+
+    if not soup.h1:
+        # In a recent PR most of the top-level headings were removed
+        # from the Markdown documents, but the code here still relies
+        # on them for building the document tree, because parsing
+        # happens based on the various headings and their number.
+        if soup.body is None:
+            return markdown_section(1, '', '', '', [])
+        first = next(soup.body.children)
+        first.insert_before(soup.new_tag('h1', 'DocumentRoot'))
+
+    
+    headings = soup.find_all(re.compile("h\d"))
+    next_heading = headings[1:] + [None]
+    
+    def sections():
+        for h, next_h in zip(headings, next_heading):
+            nodes = (n for n in h.nextSiblingGenerator())
+            selected = itertools.takewhile(lambda n: next_h is None or n != next_h, nodes)
+            concat = ""
+            first = ""
+            if as_text:
+                strings = list(filter(None, map(lambda n: getattr(n, 'text', '').strip(), selected)))
+                concat = linesep.join(strings)
+                first = strings[0] if strings else ""
+            else:
+                selected = list(selected)
+                if selected:
+                    concat = "".join(map(str, selected))
+                    first = str(selected[0])
+        
+            yield markdown_section(int(h.name[1:]), h.text, concat, first)
+
+    return section_tree(sections(), fn)
+
+
+class token_section:
+    """
+    A markdown_section of which the content is rendered from the markdown-it
+    token stream of its blocks when first accessed.
+    """
+
+    def __init__(self, level, heading, blocks, separators, linesep, as_text):
+        self.level = level
+        self.heading = heading
+        self.blocks = blocks
+        # the newlines before the first block and after the last block
+        # that python-markdown emits between sibling elements
+        self.separators = separators
+        self.linesep = linesep
+        self.as_text = as_text
+        self.children = []
+
+    def nodes(self):
+        leading, trailing = self.separators
+        for i, block in enumerate(self.blocks):
+            if i or leading:
+                yield "\n"
+            yield render_tokens(block)
+        if trailing:
+            yield "\n"
+
+    @functools.cached_property
+    def strings(self):
+        return list(filter(None, (html_to_text(n).strip() for n in map(render_tokens, self.blocks))))
+
+    @functools.cached_property
+    def content(self):
+        if self.as_text:
+            return self.linesep.join(self.strings)
+        else:
+            return "".join(self.nodes())
+
+    @functools.cached_property
+    def first_node_content(self):
+        if self.as_text:
+            return self.strings[0] if self.strings else ""
+        else:
+            return next(self.nodes(), "")
+
+
+@functools.lru_cache(maxsize=1)
+def markdown_it():
+    from markdown_it import MarkdownIt
+
+    return MarkdownIt("commonmark").enable("table")
+
+
+def render_tokens(tokens):
+    md = markdown_it()
+    return md.renderer.render(tokens, md.options, {}).rstrip("\n")
+
+
+def html_to_text(html):
+    return unescape(re.sub(r"<[^>]*>", "", html))
+
+
+def parse_tokens(data, linesep, as_text, fn=None):
+    # Tabs are expanded like python-markdown does. markdown-it-py 1.1.0 fails
+    # on a list followed by blank lines at the end.
+    tokens = markdown_it().parse(data.expandtabs(4).rstrip() + "\n")
+
+    # top-level blocks, and headings which start a section
+    blocks = []
+    start = 0
+    for i, t in enumerate(tokens):
+        if t.level == 0:
+            if t.nesting == 1:
+                start = i
+            else:
+                blocks.append(tokens[start if t.nesting == -1 else i:i + 1])
+
+    if not blocks:
+        return markdown_section(1, '', '', '', [])
+
+    def heading(block):
+        return block[0].type == "heading_open" and block[0].tag[1:].isdigit()
+
+    if not any(heading(b) and b[0].tag == "h1" for b in blocks):
+        blocks.insert(0, None)
+
+    def sections():
+        for i, b in enumerate(blocks):
+            if b is not None and not heading(b):
+                continue
+            end = next((j for j in range(i + 1, len(blocks)) if heading(blocks[j])), len(blocks))
+            if b is None:
+                # parse_html() inserts an empty h1 in this case
+                level, text, separators = 1, "", (False, end < len(blocks))
+            else:
+                level, text, separators = int(b[0].tag[1:]), html_to_text(render_tokens(b[1:-1])), (True, end < len(blocks))
+            yield token_section(level, text, blocks[i + 1:end], separators, linesep, as_text)
+
+    return section_tree(sections(), fn)
+
+
 class markdown_attribute_parser:
-    def __init__(self, *, fn=None, data=None, as_text=True, heading_name="Attributes", short=False, linesep=""):
+    def __init__(self, *, fn=None, data=None, root=None, as_text=True, heading_name="Attributes", short=False, linesep=""):
     
         self.heading_name = heading_name
-        self.root = parse_document(fn=fn, data=data, as_text=as_text, linesep=linesep)
+        # root is a tree returned by parse_document() earlier
+        self.root = root if root is not None else parse_document(fn=fn, data=data, as_text=as_text, linesep=linesep)
         self.children = {}
         self.status = {}
         self.short = short
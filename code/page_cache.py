@@ -0,0 +1,192 @@
+"""
+Size-bounded caches for fully rendered documentation pages.
+
+The server only renders from files that change when the poller pulls a new
+commit or regenerates the schema resources, so a page is identified by its
+request path and flags together with a fingerprint of the git HEAD and the
+modification times of the generated resources. A new fingerprint simply
+results in new keys; stale entries are evicted in least recently used order.
+
+Backends:
+
+    memory_page_cache(max_bytes)             per process
+    disk_page_cache(directory, max_bytes)    shared between gunicorn workers
+    redis_page_cache(redis, max_bytes)       shared between containers
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+
+def git_head(repo_dir):
+    """
+    The commit hash of HEAD, by reading the git metadata directly instead of
+    spawning a subprocess on every request.
+    """
+    git_dir = os.path.join(repo_dir, ".git")
+    try:
+        with open(os.path.join(git_dir, "HEAD"), encoding="ascii") as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[5:]
+        try:
+            with open(os.path.join(git_dir, ref), encoding="ascii") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            with open(os.path.join(git_dir, "packed-refs"), encoding="ascii") as f:
+                for ln in f:
+                    if ln.rstrip().endswith(" " + ref):
+                        return ln.split(" ")[0]
+    except OSError:
+        pass
+    return ""
+
+
+def fingerprint(paths, repo_dir):
+    h = hashlib.sha1(git_head(repo_dir).encode("ascii"))
+    for p in paths:
+        try:
+            st = os.stat(p)
+            h.update(f"{p}:{st.st_mtime_ns}:{st.st_size};".encode("utf-8"))
+        except OSError:
+            h.update(f"{p}:-;".encode("utf-8"))
+    return h.hexdigest()
+
+
+def make_key(*parts):
+    return hashlib.sha256("\0".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+
+class memory_page_cache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        # for threaded workers
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class disk_page_cache:
+    """
+    One file per page, the file modification time is used as the access
+    time for eviction (atime is commonly disabled on mounts). The total size
+    is tracked per process and the directory is only scanned when the limit
+    appears to be exceeded.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".html")
+
+    def get(self, key):
+        fn = self.path(key)
+        try:
+            with open(fn, "rb") as f:
+                data = f.read()
+            os.utime(fn)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path(key))
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            try:
+                st = e.stat()
+            except FileNotFoundError:
+                # removed by another worker
+                continue
+            entries.append((st.st_mtime, st.st_size, e.path))
+        entries.sort()
+        self.size = sum(e[1] for e in entries)
+        target = self.max_bytes * 0.9
+        for _, size, fn in entries:
+            if self.size <= target:
+                break
+            try:
+                os.unlink(fn)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+class redis_page_cache:
+    """
+    Pages are stored as plain keys, a sorted set ranks them by last access
+    and a counter keeps the total number of bytes so that the oldest pages
+    can be removed when the limit is exceeded.
+    """
+
+    def __init__(self, redis, max_bytes, prefix="page:"):
+        self.redis = redis
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.lru = prefix + "lru"
+        self.bytes = prefix + "bytes"
+
+    def get(self, key):
+        data = self.redis.get(self.prefix + key)
+        if data is not None:
+            self.redis.zadd(self.lru, {key: time.time()})
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        replaced = self.redis.strlen(self.prefix + key)
+        pipe = self.redis.pipeline()
+        pipe.set(self.prefix + key, data)
+        pipe.zadd(self.lru, {key: time.time()})
+        pipe.incrby(self.bytes, len(data) - replaced)
+        size = pipe.execute()[-1]
+        while size > self.max_bytes:
+            oldest = self.redis.zpopmin(self.lru, 16)
+            if not oldest:
+                break
+            for k, _ in oldest:
+                k = k.decode("ascii") if isinstance(k, bytes) else k
+                evicted = self.redis.strlen(self.prefix + k)
+                self.redis.delete(self.prefix + k)
+                size = self.redis.decrby(self.bytes, evicted)
@@ -277,6 +277,14 @@ if __name__ == "__main__":
             do_print(x)
 
 
+    # Reverse index of the declarations in which a resource name occurs
+    references = defaultdict(set)
+    for name, express in definitions.items():
+        for w in set(re.split('[^a-zA-Z]', express)):
+            if w != name and (w in definitions or w in type_values):
+                references[w].add(name)
+    references = {k: sorted(v) for k, v in sorted(references.items())}
+
     json.dump(supertype, open("entity_supertype.json", "w", encoding="utf-8"))
     json.dump(entity_to_package, open("entity_to_package.json", "w", encoding="utf-8"))
     json.dump(hierarchy, open("hierarchy.json", "w", encoding="utf-8"))
@@ -287,3 +295,4 @@ if __name__ == "__main__":
     json.dump(abstract_entities, open("abstract_entities.json", "w", encoding="utf-8"))
     json.dump(type_values, open("type_values.json", "w", encoding="utf-8"))
     json.dump(where_clauses, open("entity_where_clauses.json", "w", encoding="utf-8"))
+    json.dump(references, open("entity_references.json", "w", encoding="utf-8"))
@@ -0,0 +1,173 @@
+"""
+Renders the complete documentation website to static HTML files.
+
+Usage: python prerender.py [-j <processes>] [--listings-only] [<output_dir>]
+
+Every route is enumerated from the schema resources and the documentation
+directories and rendered through the Flask application in a pool of worker
+processes, so no HTTP server is involved. The listings of references,
+figures and tables are collected in-process while rendering and written to
+listing_*.json, after which the listing pages themselves are rendered.
+
+With --listings-only no HTML is written, which replaces spidering the live
+website to populate the listings.
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import multiprocessing
+
+from collections import defaultdict
+
+import server
+from flask import url_for
+
+from server import app, R, make_url
+
+LISTING_KINDS = "references", "figures", "tables"
+
+
+def flatten(entries):
+    for e in entries:
+        yield e
+        yield from flatten(e.children or [])
+
+
+def enumerate_pages():
+    """
+    Yields the request paths of all pages, except the listings of
+    references, figures and tables which depend on all other pages.
+    """
+    with app.test_request_context():
+        server.before()
+
+        yield "/"
+        yield make_url("toc.html")
+
+        for s in server.content_names + server.content_names_2:
+            if s != "cover" and os.path.exists(os.path.join(server.REPO_DIR, "content", s + ".md")):
+                yield make_url(f"content/{s}.htm")
+
+        yield make_url("concepts/content.html")
+        for path in ([""], ["Partial Templates"]):
+            for c in flatten(server.make_concept(path).children):
+                yield c.url
+
+        for i, (cat, schemas) in enumerate(R.hierarchy, start=5):
+            yield make_url(f"chapter-{i}/")
+            for schema_name, _ in schemas:
+                yield url_for("schema", name=schema_name.lower())
+
+        for name in server.name_to_number():
+            yield url_for("resource", resource=name)
+
+        for prop in sorted(set(p["name"] for pdef in R.pset_definitions.values() for p in pdef["properties"])):
+            yield url_for("property", prop=prop)
+
+        for annex in ("a", "a-express", "a-xsd", "b", "b1", "b2", "b3", "b4", "b5", "b6", "b7", "c", "d", "e", "f"):
+            yield make_url(f"annex-{annex}.html")
+
+        for fn in sorted(glob.glob(os.path.join(server.REPO_DIR, "output/IFC.xml/*.png"))):
+            yield url_for("annex_d_diagram_page", s=os.path.basename(fn).split(".")[0])
+
+        examples, _ = server.build_example_tree(return_list_and_tree=True)
+        for s in examples:
+            yield url_for("annex_e_example_page", s=s)
+
+
+def output_filename(output_dir, path):
+    if path.endswith("/"):
+        path += "index.html"
+    return os.path.join(output_dir, *path.strip("/").split("/"))
+
+
+def render(args):
+    path, output_dir = args
+
+    server.listing_collector = defaultdict(list)
+    response = app.test_client().get(path)
+    listings, server.listing_collector = server.listing_collector, None
+
+    if output_dir and response.status_code == 200:
+        fn = output_filename(output_dir, path)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, "wb") as f:
+            f.write(response.get_data())
+
+    return path, response.status_code, dict(listings)
+
+
+def initialize_worker():
+    # Cached pages would not contribute to the listings
+    server.page_cache = None
+    server.redis = None
+
+
+def render_all(paths, output_dir, processes):
+    listings = defaultdict(list)
+    failed = []
+
+    with multiprocessing.Pool(processes, initializer=initialize_worker) as pool:
+        for path, status, entries in pool.imap_unordered(render, [(p, output_dir) for p in paths], chunksize=8):
+            if status != 200:
+                failed.append((path, status))
+            for kind, es in entries.items():
+                listings[kind].extend(es)
+
+    return listings, failed
+
+
+def copy_static_files(output_dir):
+    base = output_filename(output_dir, make_url())
+    for src, dst in (("docs/figures", "figures"), ("docs/assets", "assets")):
+        src = os.path.join(server.REPO_DIR, src)
+        if os.path.exists(src):
+            shutil.copytree(src, os.path.join(base, dst), dirs_exist_ok=True)
+    for fn, dst in (("IFC.exp", f"{server.SCHEMA_NAME}.exp"), ("IFC.xsd", f"{server.SCHEMA_NAME}.xsd"), ("psd.zip", "annex-a-psd.zip")):
+        if os.path.exists(fn):
+            shutil.copyfile(fn, os.path.join(base, dst))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    processes = os.cpu_count()
+    listings_only = False
+
+    if "-j" in args:
+        i = args.index("-j")
+        processes = int(args[i + 1])
+        args[i:i + 2] = []
+    if "--listings-only" in args:
+        args.remove("--listings-only")
+        listings_only = True
+
+    if listings_only:
+        output_dir = None
+    elif len(args) == 1:
+        output_dir = os.path.abspath(args[0])
+    else:
+        print("Usage: python prerender.py [-j <processes>] [--listings-only] [<output_dir>]", file=sys.stderr)
+        exit(1)
+
+    t0 = time.time()
+
+    paths = list(dict.fromkeys(enumerate_pages()))
+    print(f"Rendering {len(paths)} pages on {processes} processes")
+
+    listings, failed = render_all(paths, output_dir, processes)
+    server.write_listings(listings)
+
+    listing_paths = [make_url("index.htm")] + [make_url(f"listing-{x}.html") for x in LISTING_KINDS]
+    _, failed_listings = render_all(listing_paths, output_dir, processes)
+    failed += failed_listings
+
+    if output_dir:
+        copy_static_files(output_dir)
+
+    for path, status in failed:
+        print(f"Warning: {path} responded with {status}", file=sys.stderr)
+
+    print(f"Rendered {len(paths) + len(listing_paths) - len(failed)} pages in {time.time() - t0:.1f}s")
@@ -585,7 +585,7 @@ class Tex_object(object):
 
 if __name__ == '__main__':
 
-    xmi = xmi.doc(xmi_fn)
+    xmi = xmi.load(xmi_fn)
     entities_to_retain = None # {{'IfcBuilding', 'IfcPostalAddress', 'IfcFacility', 'IfcSpatialStructureElement', 'IfcSpatialElement', 'IfcRelContainedInSpatialStructure'} # , 'IfcSlab', 'IfcDoor', 'IfcWindow', 'IfcRail', 'IfcRoad', 'IfcBridge',
                               #  'IfcWallTypeEnum', 'Pset_WallCommon','Pset_WindowCommon','Qto_WindowBaseQuantities', 
                               #  'IfcBuildingElement','IfcELement','IfcWindowStandardCase','RACK-RAIL','GUARD-RAIL','RAIL','STOCK-RAIL','CHECK-RAIL'}
@@ -0,0 +1,89 @@
+"""
+Renders all Graphviz diagrams of the documentation ahead of time, so that
+requests do not have to wait for dot.
+
+Usage: python render_diagrams.py [-j <processes>]
+
+The figures in docs/schemas and the concept diagrams in docs/templates are
+transformed like the server does on a page request and rendered into the
+diagram cache (svgs/). The manifest lists the diagrams and their source file,
+these are not removed when the cache exceeds its size limit.
+
+The schema resources are read from the code directory, regardless of
+SERVE_GENERATIONS.
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import tempfile
+import multiprocessing
+
+# From the resources the build has just written, which are published after
+# this stage, rather than from the previous generation
+os.environ["SERVE_GENERATIONS"] = "0"
+
+import server
+from server import app
+
+
+def enumerate_diagrams():
+    for fn in sorted(glob.glob(os.path.join(server.REPO_DIR, "docs/schemas/**/*.md"), recursive=True)):
+        md = open(fn, encoding="utf-8").read()
+        if "dot_figure" in md or "dot_inheritance" in md or "dot_neato" in md:
+            yield "resource", os.path.basename(fn)[:-3], fn
+
+    md_root = os.path.join(server.REPO_DIR, "docs/templates")
+    for fn in sorted(glob.glob(os.path.join(md_root, "**/README.md"), recursive=True)):
+        md = open(fn, encoding="utf-8").read()
+        if "concept {" in md:
+            s = os.path.relpath(os.path.dirname(fn), md_root).replace("\\", "/")
+            if s.startswith("Partial Templates/"):
+                s = s[len("Partial Templates/"):]
+            yield "concept", "".join(c for c in s if c.isalnum()), fn
+
+
+def render(args):
+    kind, name, fn = args
+    md = open(fn, encoding="utf-8").read()
+
+    with app.test_request_context():
+        server.before()
+        if kind == "concept":
+            md = server.process_graphviz_concept(name, md[md.index("```"):])
+        else:
+            md = server.process_graphviz(name, re.sub(server.DOC_ANNOTATION_PATTERN, "", md))
+
+    return os.path.relpath(fn, server.REPO_DIR).replace("\\", "/"), re.findall(r"/svgs/(\w+)\.svg", md)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    processes = os.cpu_count()
+
+    if "-j" in args:
+        i = args.index("-j")
+        processes = int(args[i + 1])
+        args[i:i + 2] = []
+
+    t0 = time.time()
+
+    diagrams = list(enumerate_diagrams())
+    print(f"Rendering diagrams of {len(diagrams)} documents on {processes} processes")
+
+    manifest = {}
+    with multiprocessing.Pool(processes) as pool:
+        for fn, keys in pool.imap_unordered(render, diagrams, chunksize=4):
+            for key in keys:
+                manifest[key] = fn
+
+    directory = server.diagram_cache.directory
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=1)
+    os.replace(tmp, os.path.join(directory, "manifest.json"))
+
+    print(f"Rendered {len(manifest)} diagrams in {time.time() - t0:.1f}s")
@@ -0,0 +1,96 @@
+"""
+Listings of the names in the schema, their section numbers and the model
+view and product qualification of entities, as shown on the Annex B
+dictionary pages.
+These are derived from the schema resources of the server and computed
+again only when one of those is reloaded, rather than on every request.
+"""
+
+import re
+
+from collections import defaultdict
+
+KINDS = "Types", "Entities", "Property Sets", "Quantity Sets", "Functions", "Rules", "PropertyEnumerations"
+
+
+class versioned:
+    """
+    A value derived from schema resources by fn(*resources), computed again
+    when the version of one of the resources changes.
+    """
+
+    def __init__(self, fn, *resources):
+        self.fn = fn
+        self.resources = resources
+        self.state = None, None
+
+    def __call__(self):
+        versions = tuple(r.version() for r in self.resources)
+        state = self.state
+        if state[0] != versions:
+            # replaced at once, other threads may be reading the previous value
+            self.state = state = versions, self.fn(*self.resources)
+        return state[1]
+
+
+def names_by_kind(hierarchy):
+    """
+    The sorted names of every kind of definition (Types, Entities, ...)
+    """
+    names = defaultdict(list)
+    for _, schemas in hierarchy:
+        for _, members in schemas:
+            for kind in KINDS:
+                names[kind].extend(members.get(kind, ()))
+    return {kind: sorted(names[kind]) for kind in KINDS}
+
+
+def section_numbers(hierarchy):
+    """
+    The section number of every definition, chapters 5 to 8 are the
+    categories of schemas in the hierarchy.
+    """
+    ntn = {}
+
+    for i, (cat, schemas) in enumerate(hierarchy, start=5):
+        for j, (schema_name, members) in enumerate(schemas, start=1):
+            for k, ke in enumerate(KINDS, start=2):
+                for l, name in enumerate(members.get(ke, ()), start=1):
+                    ntn[name] = ".".join(map(str, (i, j, k, l)))
+
+    return ntn
+
+
+def property_names(pset_definitions):
+    return sorted(set(p["name"] for pdef in pset_definitions.values() for p in pdef["properties"]))
+
+
+def mvd_abbreviation(name):
+    # e.g. Reference-View -> RV
+    return "".join(re.findall("[A-Z]|(?<=-)[a-z]", name))
+
+
+def mvd_qualification(hierarchy, mvd_entity_usage):
+    """
+    For every entity whether, and why, it is used in each of the model views
+    """
+    mvds = [(mvd_abbreviation(k), v) for k, v in mvd_entity_usage.items()]
+    return {
+        n: [{"abbr": abbr, "cause": usage.get(n), "on": n in usage} for abbr, usage in mvds]
+        for n in names_by_kind(hierarchy)["Entities"]
+    }
+
+
+def product_or_type(hierarchy, entity_supertype):
+    """
+    For every entity whether it is a subtype of IfcProduct or IfcTypeProduct
+    """
+    def qualifies(n):
+        e = entity_supertype.get(n)
+        while e:
+            if e in ("IfcProduct", "IfcTypeProduct"):
+                return True
+            e = entity_supertype.get(e)
+        return False
+
+    return {n: qualifies(n) for n in names_by_kind(hierarchy)["Entities"]}
@@ -1,18 +1,15 @@
 import re
 import os
 import sys
-import copy
 import uuid
 import glob
 import json
 import html
-import shutil
-import hashlib
 import operator
 import functools
 import itertools
-import subprocess
 
+from types import MappingProxyType
 from collections import defaultdict, Counter
 from dataclasses import dataclass
 from functools import lru_cache
@@ -33,6 +30,7 @@ def BeautifulSoup(*args):
 
 
 import flask
+import werkzeug.exceptions
 from flask import (
     Flask,
     send_file,
@@ -47,6 +45,11 @@ from flask import (
 )
 
 import md as mdp
+import generation
+import schema_index
+from schema_index import versioned
+from page_cache import memory_page_cache, disk_page_cache, redis_page_cache, fingerprint, make_key
+from graphviz_cache import svg_cache
 from extract_concepts_from_xmi import parse_bindings
 
 app = Flask(__name__)
@@ -69,56 +72,79 @@ identity = lambda x: x
 REPO_DIR = os.path.abspath(os.environ.get("REPO_DIR", os.path.join(os.path.dirname(__file__), "..")))
 REPO_BRANCH = os.environ.get("REPO_BRANCH", "master")
 
+# Read the generated files from the generation published last by build.py
+# rather than from the working directory, see README.md
+SERVE_GENERATIONS = os.environ.get("SERVE_GENERATIONS", "0") == "1"
+
 class schema_resource:
+    """
+    A JSON resource, loaded on first use. Accessors read the loaded data
+    directly, whether the file changed is only checked by refresh(), once
+    per request. The data is replaced on reload, never modified.
+    """
+
     def __init__(self, path, transform=identity):
         self.path = path
+        # the file in the current generation, see resource_manager.refresh()
+        self.fn = path
         self.transform = transform
         self.mtime = 0
-        self.data = None
 
-    def load(fn):
-        def inner(self, *args):
-            try:
-                mt = os.path.getmtime(self.path)
-                if mt > self.mtime:
-                    self.data = self.transform(json.load(open(self.path, encoding="utf-8")))
-                    self.mtime = mt
-            except:
-                print("Path", self.path, "not available")
-                abort(503)
+    def read(self):
+        try:
+            mt = os.path.getmtime(self.fn)
+            data = self.transform(json.load(open(self.fn, encoding="utf-8")))
+        except:
+            print("Path", self.fn, "not available")
+            abort(503)
 
-            return fn(self, *args)
+        self.mtime = mt
+        return data
 
-        return inner
+    @functools.cached_property
+    def data(self):
+        return self.read()
+
+    def refresh(self, fn):
+        self.fn = fn
+        if "data" not in self.__dict__:
+            return
+        try:
+            # unchanged files are hard links to those of the previous generation
+            changed = os.path.getmtime(fn) > self.mtime
+        except:
+            print("Path", fn, "not available")
+            abort(503)
+        if changed:
+            self.data = self.read()
 
-    @load
     def __getitem__(self, k):
         return self.data[k]
 
-    @load
     def __contains__(self, k):
         return k in self.data
 
-    @load
     def get(self, k, default=None):
         return self.data.get(k, default)
 
-    @load
     def items(self):
         return self.data.items()
 
-    @load
     def keys(self):
         return self.data.keys()
 
-    @load
     def values(self):
         return self.data.values()
 
+    def version(self):
+        self.data
+        return self.mtime
+
 
 class resource_manager:
     entity_attributes = schema_resource("entity_attributes.json")
     entity_definitions = schema_resource("entity_definitions.json")
+    entity_references = schema_resource("entity_references.json")
     entity_to_package = schema_resource("entity_to_package.json")
     entity_supertype = schema_resource("entity_supertype.json")
     entity_where_clauses = schema_resource("entity_where_clauses.json")
@@ -129,6 +155,7 @@ class resource_manager:
     type_values = schema_resource("type_values.json")
     hierarchy = schema_resource("hierarchy.json")
     xmi_concepts = schema_resource("xmi_concepts.json")
+    xmi_concepts_by_entity = schema_resource("xmi_concepts_by_entity.json")
     xmi_mvd_concepts = schema_resource("xmi_mvd_concepts.json")
     examples_by_type = schema_resource("examples_by_type.json")
     mvd_entity_usage = schema_resource("mvd_entity_usage.json")
@@ -137,10 +164,109 @@ class resource_manager:
     listing_tables = schema_resource("listing_tables.json")
     listing_figures = schema_resource("listing_figures.json")
 
+    def __init__(self):
+        self.generation = None
+        self.files = {}
+
+    def resources(self):
+        return [r for r in vars(resource_manager).values() if isinstance(r, schema_resource)]
+
+    def path(self, fn):
+        """
+        The path of a generated file in the current generation, or in the
+        working directory when it is not published by build.py.
+        """
+        return self.files.get(fn, fn)
+
+    def refresh(self):
+        """
+        Switches to the generation published last, with SERVE_GENERATIONS=1,
+        and reloads the resources that changed, called before every request.
+        """
+        current = generation.current_generation() if SERVE_GENERATIONS else None
+        if current != self.generation:
+            self.files = generation.generation_files(current)
+            self.generation = current
+        for r in self.resources():
+            r.refresh(self.path(r.path))
+
+    def load(self):
+        """
+        Loads or refreshes all resources that are available
+        """
+        self.refresh()
+        for r in self.resources():
+            try:
+                r.version()
+            except werkzeug.exceptions.HTTPException:
+                pass
+
 
 R = resource_manager()
 
 
+class inheritance_index:
+    """
+    Subtypes, supertype chains and depth of every entity, derived from
+    entity_supertype.json and rebuilt only when that resource is reloaded.
+    """
+
+    def __init__(self, supertype):
+        self.supertype = supertype
+        self.version = None
+        self.subtypes = {}
+        self.supertypes = {}
+
+    def update(self):
+        version = self.supertype.version()
+        if version == self.version:
+            return
+        subtypes = defaultdict(list)
+        for k, v in self.supertype.items():
+            if v:
+                subtypes[v].append(k)
+        supertypes = {}
+        for k in self.supertype.keys():
+            chain = []
+            e = self.supertype.get(k)
+            while e:
+                chain.append(e)
+                e = self.supertype.get(e)
+            supertypes[k] = tuple(chain)
+        # replaced at once, other threads may be reading the previous tables
+        self.subtypes, self.supertypes = {k: sorted(v) for k, v in subtypes.items()}, supertypes
+        self.version = version
+
+    def children(self, entity):
+        """
+        Direct subtypes, sorted by name
+        """
+        self.update()
+        return self.subtypes.get(entity, [])
+
+    def ancestors(self, entity):
+        """
+        Supertypes, starting at the direct supertype
+        """
+        self.update()
+        return self.supertypes.get(entity, ())
+
+    def depth(self, entity):
+        return len(self.ancestors(entity))
+
+    def supertype_chain(self, entity):
+        """
+        The entity and its supertypes, starting at the root
+        """
+        return list(self.ancestors(entity)[::-1]) + [entity]
+
+    def is_subtype_of(self, entity, *supertypes):
+        return any(e in supertypes for e in self.ancestors(entity))
+
+
+inheritance = inheritance_index(R.entity_supertype)
+
+
 def resource_paths(pairs, path=None):
     if isinstance(pairs, dict):
         pairs = list(pairs.items())
@@ -214,40 +340,83 @@ annex_b_navigation = [
 ]
 
 
+class navigation_index:
+    """
+    The navigation trees with the current items marked, built once for every
+    chapter and subchapter number and current page, and again only when
+    hierarchy.json is reloaded. The trees are shared between requests and
+    consist of tuples and read-only mappings.
+    """
+
+    def __init__(self, hierarchy):
+        self.hierarchy = hierarchy
+        self.version = None
+        self.trees = {}
+        self.urls = {item["url"] for section in navigation for item in section}
+
+    def get(self, number, subchapter, path):
+        if number in (5, 6, 7, 8) and subchapter is not None:
+            # the subchapters are listed from hierarchy.json
+            version = self.hierarchy.version()
+            if version != self.version:
+                self.trees, self.version = {}, version
+        # only the parts of the path that determine the current items
+        current = path if path in self.urls else None
+        annex_b = "annex-b" in path and tuple(
+            s["number"] for s in annex_b_navigation if ("annex-" + s["number"]).lower().replace(".", "") in path
+        )
+        key = number, subchapter, current, annex_b
+        tree = self.trees.get(key)
+        if tree is None:
+            tree = self.trees[key] = self.build(*key)
+        return tree
+
+    def build(self, number, subchapter, current, annex_b):
+        def item(data, is_current, subitems=()):
+            return MappingProxyType({**data, "is_current": is_current, "subitems": tuple(subitems)})
+
+        def items(section):
+            for data in section:
+                if data["url"] == current:
+                    yield item(data, True)
+                elif number and data.get("number", None) == number:
+                    subitems = []
+                    if number in (5, 6, 7, 8) and subchapter is not None:
+                        subchapters = [items for t, items in self.hierarchy if t == data["name"]][0]
+                        for i, s in enumerate(subchapters, 1):
+                            sub = {
+                                "url": url_for("schema", name=s[0].lower()),
+                                "number": f"{number}.{i}",
+                                "name": s[0],
+                            }
+                            if i == int(subchapter):
+                                sub["is_current"] = True
+                            subitems.append(MappingProxyType(sub))
+                    yield item(data, True, subitems)
+                elif annex_b is not False and data.get("number", None) == "B":
+                    yield item(data, True, (
+                        MappingProxyType(dict(s, is_current=True) if s["number"] in annex_b else s) for s in annex_b_navigation
+                    ))
+                else:
+                    yield item(data, False)
+
+        return tuple(tuple(items(section)) for section in navigation)
+
+
+navigation_tree = navigation_index(R.hierarchy)
+
+
 def get_navigation(resource=None, number=None):
+    """
+    The navigation for the current page, see navigation_index.
+    """
     if not number and resource:
         number = name_to_number()[resource]
     numbers = []
     if isinstance(number, str):
         numbers = number.split(".")
         number = int(numbers[0])
-    for section in navigation:
-        for item in section:
-            item["subitems"] = []
-            if item["url"] == request.path:
-                item["is_current"] = True
-            elif number and item.get("number", None) == number:
-                item["is_current"] = True
-                if number in (5, 6, 7, 8) and len(numbers) >= 2:
-                    subchapters = [items for t, items in R.hierarchy if t == item["name"]][0]
-                    for i, subchapter in enumerate(subchapters, 1):
-                        data = {
-                            "url": url_for("schema", name=subchapter[0].lower()),
-                            "number": f"{number}.{i}",
-                            "name": subchapter[0],
-                        }
-                        if i == int(numbers[1]):
-                            data["is_current"] = True
-                        item["subitems"].append(data)
-            elif "annex-b" in request.path and item.get("number", None) == "B":
-                item["is_current"] = True
-                for subitem in copy.deepcopy(annex_b_navigation):
-                    if ("annex-" + subitem["number"]).lower().replace(".", "") in request.path:
-                        subitem["is_current"] = True
-                    item["subitems"].append(subitem)
-            else:
-                item["is_current"] = False
-    return navigation
+    return navigation_tree.get(number, numbers[1] if len(numbers) >= 2 else None, request.path)
 
 
 @dataclass(order=True, eq=True, frozen=True)
@@ -279,33 +448,21 @@ def chapter_lookup(number=None, cat=None):
     return do_chapter_lookup(navigation)
 
 
-entity_names = lambda: sorted(sum([schema.get("Entities", []) for _, cat in R.hierarchy for __, schema in cat], []))
-function_names = lambda: sorted(sum([schema.get("Functions", []) for _, cat in R.hierarchy for __, schema in cat], []))
-rule_names = lambda: sorted(sum([schema.get("Rules", []) for _, cat in R.hierarchy for __, schema in cat], []))
-type_names = lambda: sorted(sum([schema.get("Types", []) for _, cat in R.hierarchy for __, schema in cat], []))
-propertyenumeration_names = lambda: sorted(sum([schema.get("PropertyEnumerations", []) for _, cat in R.hierarchy for __, schema in cat], []))
-
-
-@lru_cache()
-def name_to_number():
-    ntn = {}
+schema_names = versioned(schema_index.names_by_kind, R.hierarchy)
+entity_names = lambda: schema_names()["Entities"]
+function_names = lambda: schema_names()["Functions"]
+rule_names = lambda: schema_names()["Rules"]
+type_names = lambda: schema_names()["Types"]
+propertyenumeration_names = lambda: schema_names()["PropertyEnumerations"]
 
-    for i, (cat, schemas) in enumerate(R.hierarchy, start=5):
-        for j, (schema_name, members) in enumerate(schemas, start=1):
-            for k, ke in enumerate(
-                ["Types", "Entities", "Property Sets", "Quantity Sets", "Functions", "Rules", "PropertyEnumerations"], start=2
-            ):
-                for l, name in enumerate(members.get(ke, ()), start=1):
-                    ntn[name] = ".".join(map(str, (i, j, k, l)))
-
-    return ntn
+name_to_number = versioned(schema_index.section_numbers, R.hierarchy)
 
 
 def get_inheritance_graph(current_entity):
     graph = []
 
     tier = []
-    for subclass in sorted([k for k, v in R.entity_supertype.items() if v == current_entity]):
+    for subclass in inheritance.children(current_entity):
         tier.append(
             {
                 "name": subclass,
@@ -317,13 +474,11 @@ def get_inheritance_graph(current_entity):
     if tier:
         graph.append(tier)
 
-    previous = None
-    entity = current_entity
-    while entity:
+    for entity in (current_entity,) + inheritance.ancestors(current_entity):
         tier = []
         parent = R.entity_supertype.get(entity, None)
         if parent:
-            siblings = sorted([k for k, v in R.entity_supertype.items() if v == parent])
+            siblings = inheritance.children(parent)
         else:
             siblings = [entity]
         for sibling in siblings:
@@ -339,7 +494,6 @@ def get_inheritance_graph(current_entity):
             else:
                 tier.append(data)
         graph.append(tier)
-        entity, old = R.entity_supertype.get(entity), entity
     return reversed(graph)
 
 
@@ -353,15 +507,10 @@ def get_node_type(n):
     if n not in R.entity_definitions:
         return "attribute"
 
-    def is_relationship(ty=n):
-        if ty == "IfcRelationship" or ty == "IfcResourceLevelRelationship":
-            return True
-        ty = R.entity_supertype.get(ty)
-        if ty:
-            return is_relationship(ty)
-        return False
+    relationship_roots = ("IfcRelationship", "IfcResourceLevelRelationship")
+    is_relationship = n in relationship_roots or inheritance.is_subtype_of(n, *relationship_roots)
 
-    return "relationship" if is_relationship() else "entity"
+    return "relationship" if is_relationship else "entity"
 
 
 def transform_graph(current_entity, graph_data, only_urls=False):
@@ -392,7 +541,7 @@ def transform_graph(current_entity, graph_data, only_urls=False):
 
         # add nodes to cluster that aren't explicitly declared
         # in the graph
-        for n in edge_nodes_in_cluster - all_nodes:
+        for n in sorted(edge_nodes_in_cluster - all_nodes):
             g.add_node(pydot.Node(n))
 
         for n in list(g.get_nodes()):
@@ -448,7 +597,7 @@ def transform_graph(current_entity, graph_data, only_urls=False):
                     n.set(*kv)
 
             if nm.startswith("Ifc"):
-                n.set("URL", url_for("resource", resource=nm, _external=True))
+                n.set("URL", url_for("resource", resource=nm))
 
         for sg in g.get_subgraphs():
             visit_graph(sg)
@@ -459,6 +608,15 @@ def transform_graph(current_entity, graph_data, only_urls=False):
     return graph.to_string()
 
 
+# Rendered diagrams are reused when the dot source is unchanged.
+# SVG_CACHE_SIZE in MB, GRAPHVIZ_PROCESSES concurrent dot invocations per worker
+diagram_cache = svg_cache(
+    "svgs",
+    int(os.environ.get("SVG_CACHE_SIZE", "1024")) * 1024 * 1024,
+    int(os.environ.get("GRAPHVIZ_PROCESSES", str(os.cpu_count() or 1))),
+)
+
+
 def process_graphviz(current_entity, md):
     def is_figure(s):
         if "dot_figure" in s:
@@ -477,6 +635,7 @@ def process_graphviz(current_entity, md):
         is_markdown = False
         graphviz_code = filter(is_figure, re.findall("<pre><code>(.*?)</code></pre>", md or "", re.S))
 
+    keys = []
     for c in graphviz_code:
         if not is_markdown:
             escaped_c = c
@@ -486,27 +645,22 @@ def process_graphviz(current_entity, md):
         if is_figure(c) == 3:
             layout_engine = "neato"
 
-        hash = hashlib.sha256(c.encode("utf-8")).hexdigest()
-        fn = os.path.join("svgs", current_entity + "_" + hash + ".dot")
         c2 = transform_graph(current_entity, c, only_urls=is_figure(c) == 2)
-        with open(fn, "w") as f:
-            f.write(c2)
-        if is_markdown:
-            md = md.replace("```%s```" % c, "![dot_diagram](/svgs/%s_%s.svg)" % (current_entity, hash))
-        else:
-            md = md.replace("<pre><code>%s</code></pre>" % escaped_c, "![](/svgs/%s_%s.svg)" % (current_entity, hash))
-        subprocess.call([
-            shutil.which("dot") or "dot",
+        key = diagram_cache.submit(current_entity, c2, [
             f"-K{layout_engine}",
-            "-O",
-            "-Tsvg",
             "-n2",
             #"-Gsize=10,8",
             "-Gbgcolor=#ffffff00",
             "-Earrowsize=0.5",
             "-Earrowhead=dot",
-            fn
         ])
+        keys.append(key)
+        if is_markdown:
+            md = md.replace("```%s```" % c, "![dot_diagram](/svgs/%s.svg)" % key)
+        else:
+            md = md.replace("<pre><code>%s</code></pre>" % escaped_c, "![](/svgs/%s.svg)" % key)
+
+    diagram_cache.wait(keys)
 
     return md or ""
 
@@ -649,9 +803,8 @@ def process_graphviz_concept(name, md):
         # I don't understand this one yet.
         return f"{match.group(1)} -> {match.group(2)}:{match.group(3)}0"
 
+    keys = []
     for c in graphviz_code:
-        hash = hashlib.sha256(c.encode("utf-8")).hexdigest()
-        fn = os.path.join("svgs", name + "_" + hash + ".dot")
         c2 = c.replace("concept", "digraph")  # transform_graph(current_entity, c, only_urls=is_figure(c) == 2)
 
         c2 = re.sub("(?<=\w)\-(?=\w)", "", c2)
@@ -675,7 +828,7 @@ def process_graphviz_concept(name, md):
         G.set_splines("polyline")
         G.set_rankdir("LR")
 
-        for n in nodes:
+        for n in sorted(nodes):
             if n.startswith("Ifc"):
                 G.add_node(pydot.Node(n, label=create_entity_definition(n, bindings, node_ports.get(n, []))))
             elif n.startswith("constraint_"):
@@ -690,18 +843,18 @@ def process_graphviz_concept(name, md):
 
         c3 = G.to_string()
 
-        with open(fn, "w") as f:
-            f.write(c3)
-        md = md.replace("```%s```" % c, "![](/svgs/%s_%s.svg)" % (name, hash))
+        key = diagram_cache.submit(name, c3, ["-Gbgcolor=#ffffff00"])
+        keys.append(key)
+        md = md.replace("```%s```" % c, "![](/svgs/%s.svg)" % key)
 
-        subprocess.call([shutil.which("dot") or "dot", "-O", "-Tsvg", "-Gbgcolor=#ffffff00", fn])
+    diagram_cache.wait(keys)
 
     return md
 
 
 def get_applicable_relationships(usage, concept, resource):
-    rows = copy.deepcopy(R.xmi_concepts[usage].get(concept, []))
-    rows = [r for r in rows if r.get("ApplicableEntity") == resource]
+    rows = R.xmi_concepts_by_entity.get(resource, {}).get(usage, {}).get(concept, {}).get("rows", [])
+    rows = [dict(r) for r in rows]
     if not rows:
         return
     if len(rows[0].keys()) == 1:
@@ -766,6 +919,31 @@ def get_example(example):
 DOC_ANNOTATION_PATTERN = re.compile(r"\{\s*\..+?\}")
 
 
+@lru_cache(maxsize=mdp.MD_CACHE_SIZE)
+def parse_resource_markdown(fn, mtime):
+    with open(fn, encoding="utf-8") as f:
+        data = re.sub(DOC_ANNOTATION_PATTERN, "", f.read())
+    return mdp.parse_document(data=data, as_text=False) if data else None
+
+
+def get_resource_sections(resource):
+    """
+    The sections of the Markdown document of a resource, parsed once per
+    modification of the file and shared between requests.
+    """
+    fn = get_resource_path(resource)
+    try:
+        mtime = os.stat(fn).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+    try:
+        return parse_resource_markdown(fn, mtime)
+    except:
+        import traceback
+
+        traceback.print_exc()
+
+
 class resource_documentation_builder:
     def __init__(self, resource):
         self.resource = resource
@@ -780,24 +958,9 @@ class resource_documentation_builder:
         attrs = []
         direct_attrs = []
 
-        entity = self.resource
-        while entity:
-            markdown_filename = get_resource_path(entity)
-
-            try:
-                md_entity = re.sub(DOC_ANNOTATION_PATTERN, "", open(markdown_filename, encoding="utf-8").read())
-            except:
-                md_entity = None
-
-            entity_attrs = []
-            try:
-                if md_entity:
-                    entity_attrs = list(mdp.markdown_attribute_parser(data=md_entity, heading_name=heading, as_text=False))
-            except:
-                import traceback
-
-                traceback.print_exc()
-
+        for entity in inheritance.supertype_chain(self.resource)[::-1]:
+            root = get_resource_sections(entity)
+            entity_attrs = list(mdp.markdown_attribute_parser(root=root, heading_name=heading)) if root else []
 
             if heading == "Attributes":
                 entity_attr_di = dict(entity_attrs)
@@ -811,7 +974,6 @@ class resource_documentation_builder:
                 for a, content in entity_attrs[::-1]:
                     # remove underscored words:
                     attrs.append((entity, a, content))
-            entity = R.entity_supertype.get(entity)
 
         attrs = attrs[::-1]
 
@@ -822,15 +984,15 @@ class resource_documentation_builder:
 
         return attrs
 
-    @property
+    @functools.cached_property
     def attributes(self):
         return self.get_markdown_content("Attributes")
 
-    @property
+    @functools.cached_property
     def formal_propositions(self):
         return self.get_markdown_content("Formal Propositions")
 
-    @property
+    @functools.cached_property
     def concepts(self):
         return self.get_markdown_content("Concepts")
 
@@ -848,6 +1010,13 @@ def api_resource(resource):
     return jsonify({"resource": resource, "definition": definition, "attributes": attributes})
 
 
+@app.route("/api/v0/references/<resource>")
+def api_references(resource):
+    if resource not in R.entity_definitions and resource not in R.type_values:
+        abort(404)
+    return jsonify({"resource": resource, "references": R.entity_references.get(resource, [])})
+
+
 @app.route(make_url("property/<prop>.htm"))
 def property(prop):
     prop = "".join(c for c in prop if c.isalnum() or c in "_")
@@ -891,8 +1060,7 @@ def process_markdown(resource, mdc, process_quotes=True, number_headings=False,
     # Change svg img references to embedded svg because otherwise URLS are not interactive
     for img in soup.findAll("img"):
         if img["src"].endswith(".svg"):
-            entity, hash = img["src"].split("/")[-1].split(".")[0].split("_")
-            svg = BeautifulSoup(open(os.path.join("svgs", entity + "_" + hash + ".dot.svg")))
+            svg = BeautifulSoup(diagram_cache.read(img["src"].split("/")[-1].split(".")[0]))
             img.replaceWith(svg.find("svg"))
             img = svg
         elif img["src"].startswith("http"):
@@ -1005,10 +1173,10 @@ def resource(resource):
     except:
         abort(404)
 
-    SectionNumberGenerator.set(idx)
-    SectionNumberGenerator.begin_subsection()
+    X.section_numbers.set(idx)
+    X.section_numbers.begin_subsection()
 
-    definition_number = SectionNumberGenerator.generate()
+    definition_number = X.section_numbers.generate()
 
     html = ""
 
@@ -1026,13 +1194,7 @@ def resource(resource):
     if "Entities" in md:
         builder = resource_documentation_builder(resource)
         mvds = [{'abbr': "".join(re.findall('[A-Z]|(?<=-)[a-z]', k)), 'cause': v[resource]} for k, v in R.mvd_entity_usage.items() if resource in v]
-        is_product_or_type = False
-        entity = resource
-        while entity:
-            entity = R.entity_supertype.get(entity)
-            if entity in ("IfcProduct", "IfcTypeProduct"):
-                is_product_or_type = True
-                break
+        is_product_or_type = inheritance.is_subtype_of(resource, "IfcProduct", "IfcTypeProduct")
         return render_template(
             "entity.html",
             navigation=get_navigation(resource),
@@ -1107,22 +1269,22 @@ def get_type_values(resource, mdc):
                 description = str(description)
             described_values.append({"name": value, "description": description})
         values = described_values
-    return {"number": SectionNumberGenerator.generate(), "has_description": has_description, "schema_values": values}
+    return {"number": X.section_numbers.generate(), "has_description": has_description, "schema_values": values}
 
 
 def get_definition(resource, mdc):
     # Only match up to the first h2
     lines = []
-    SectionNumberGenerator.begin_subsection()
+    X.section_numbers.begin_subsection()
     for line in mdc.split("\n"):
         if line.startswith("## "):
             break
         if line.startswith("### "):
             words = line.split(" ")
-            line = " ".join((words[0], SectionNumberGenerator.generate(), *words[1:]))
+            line = " ".join((words[0], X.section_numbers.generate(), *words[1:]))
         lines.append(line)
     mdc = "\n".join(lines)
-    SectionNumberGenerator.end_subsection()
+    X.section_numbers.end_subsection()
     return process_markdown(resource, mdc)
 
 
@@ -1131,7 +1293,7 @@ def get_applicability(resource):
     template_type_mdc = open(template_type_md, "r", encoding="utf-8").read()
     descriptions = dict(mdp.markdown_attribute_parser(data=template_type_mdc, heading_name="Items"))
     return {
-        "number": SectionNumberGenerator.generate(),
+        "number": X.section_numbers.generate(),
         "entities": R.pset_definitions[resource]["applicability"],
         "template_type": R.pset_definitions[resource]["template_type"],
         "description": descriptions.get(R.pset_definitions[resource]["template_type"], None)
@@ -1178,7 +1340,7 @@ def get_properties(resource, mdc):
     attrs = list(map(make_prop, R.pset_definitions[resource]["properties"]))
 
     return {
-        "number": SectionNumberGenerator.generate(),
+        "number": X.section_numbers.generate(),
         "is_pset": R.pset_definitions[resource]["kind"] != "quantity_set",
         "properties": attrs,
     }
@@ -1230,7 +1392,7 @@ def get_attributes(resource, builder):
         inherited_groups_with_attributes[-1]["is_last_inherited_group"] = True
 
     return {
-        "number": SectionNumberGenerator.generate(),
+        "number": X.section_numbers.generate(),
         "groups": groups,
         "total_inherited_attributes": total_inherited_attributes,
     }
@@ -1247,7 +1409,7 @@ def get_formal_propositions(resource, builder):
         return
 
     return {
-        "number": SectionNumberGenerator.generate(),
+        "number": X.section_numbers.generate(),
         "items": [
             {"name": c[0], "formal": None, "description": f"The attribute {c[1].split(' ')[1]} should be unique" } \
             if c[1].startswith("UNIQUE ") else \
@@ -1260,7 +1422,7 @@ def get_formal_propositions(resource, builder):
 def get_entity_inheritance(resource):
     try:
         return {
-            "number": SectionNumberGenerator.generate(),
+            "number": X.section_numbers.generate(),
             "graph": get_inheritance_graph(resource),
         }
     except:
@@ -1270,35 +1432,28 @@ def get_entity_inheritance(resource):
 
 
 def get_property_sets(resource, builder):
-    ty = resource
-    supertype_chain = []
-    while ty is not None:
-        supertype_chain.append(ty)
-        ty = R.entity_supertype.get(ty)
-    supertype_chain = list(reversed(supertype_chain))
+    supertype_chain = inheritance.supertype_chain(resource)
 
     psets = []
-    for view_name, xmi_concepts in R.xmi_concepts.items():
-        for xmi_concept_name, xmi_relationships in xmi_concepts.items():
-            if "PropertySets" not in xmi_concept_name and "QuantitySets" not in xmi_concept_name:
-                continue
-            for xmi_relationship in xmi_relationships:
-                applicable_entity = xmi_relationship.get("ApplicableEntity", None)
-                if applicable_entity not in supertype_chain:
-                    continue
-                name = xmi_relationship.get("PsetName", None) or xmi_relationship.get("QsetName", None)
-                if not name:
+    for applicable_entity in supertype_chain:
+        for view_name, xmi_concepts in R.xmi_concepts_by_entity.get(applicable_entity, {}).items():
+            for xmi_concept_name, xmi_relationships in xmi_concepts.items():
+                if "PropertySets" not in xmi_concept_name and "QuantitySets" not in xmi_concept_name:
                     continue
-                properties = R.pset_definitions[name]["properties"]
-                psets.append({
-                    "name": name,
-                    "predefined_type": xmi_relationship.get("PredefinedType", None),
-                    "properties": [p["name"] for p in properties]
-                })
+                for xmi_relationship in xmi_relationships["rows"]:
+                    name = xmi_relationship.get("PsetName", None) or xmi_relationship.get("QsetName", None)
+                    if not name:
+                        continue
+                    properties = R.pset_definitions[name]["properties"]
+                    psets.append({
+                        "name": name,
+                        "predefined_type": xmi_relationship.get("PredefinedType", None),
+                        "properties": [p["name"] for p in properties]
+                    })
 
     if psets:
         return {
-            "number": SectionNumberGenerator.generate(),
+            "number": X.section_numbers.generate(),
             "psets": sorted(psets, key=lambda x: x["name"]),
         }
 
@@ -1319,12 +1474,7 @@ def get_usage_name(name):
 
 def get_concept_usage(resource, builder, mdc):
     concepts_markdown = mdp.markdown_attribute_parser(data=mdc, heading_name="Concepts", short=False)
-    ty = resource
-    supertype_chain = []
-    while ty is not None:
-        supertype_chain.append(ty)
-        ty = R.entity_supertype.get(ty)
-    supertype_chain = list(reversed(supertype_chain))
+    supertype_chain = inheritance.supertype_chain(resource)
 
     builder_concepts = list(builder.concepts)
 
@@ -1349,30 +1499,41 @@ def get_concept_usage(resource, builder, mdc):
     # > IfcWall (ifc_class):
     # > > General Usage (view_name):
     # > > > Property Sets for Objects (xmi_concept_name
-    # > > > > Relationships: [Pset_WallCommon, ...]
     # > > > > Is Inherited: True if this concept is defined explicitly for IfcWall
     # > > > > Is Inherited: False if inherited from a supertype
+    # Only the rows for the entities in the supertype chain are looked up, the
+    # order of views and concepts is that of xmi_concepts.json.
+    applicable_rows = defaultdict(dict)
+    for applicable_entity in supertype_chain:
+        for view_name, xmi_concepts in R.xmi_concepts_by_entity.get(applicable_entity, {}).items():
+            for xmi_concept_name, xmi_relationships in xmi_concepts.items():
+                applicable_rows[(view_name, xmi_concept_name)][applicable_entity] = xmi_relationships
+
+    view_order = {v: i for i, v in enumerate(R.xmi_concepts.keys())}
+    concept_order_in_view = {
+        v: {c: i for i, c in enumerate(R.xmi_concepts[v].keys())} for v in set(v for v, _ in applicable_rows)
+    }
+
     concept_groups = {}
     groups = []
-    for view_name, xmi_concepts in R.xmi_concepts.items():
-        applicable_concepts = []
-        for xmi_concept_name, xmi_relationships in xmi_concepts.items():
-            for xmi_relationship in xmi_relationships:
-                applicable_entity = xmi_relationship.get("ApplicableEntity", None)
-                in_chain = False
-                for ifc_class in supertype_chain:
-                    if ifc_class == applicable_entity:
-                        in_chain = True
-                    if not in_chain:
-                        continue
-                    is_inherited = ifc_class != applicable_entity
+    for view_name, xmi_concept_name in sorted(
+        applicable_rows, key=lambda vc: (view_order[vc[0]], concept_order_in_view[vc[0]][vc[1]])
+    ):
+        rows_by_entity = applicable_rows[(view_name, xmi_concept_name)]
+        first = None
+        for ifc_class in supertype_chain:
+            rows = rows_by_entity.get(ifc_class)
+            if rows:
+                if first is None or rows["position"] < first["position"]:
+                    first = rows
+            if first is None:
+                continue
+            # Concepts are considered inherited, unless the first row in the supertype chain is for this class
+            is_inherited = first["rows"][0]["ApplicableEntity"] != ifc_class
 
-                    concept_groups.setdefault(ifc_class, {})
-                    concept_groups[ifc_class].setdefault(view_name, {})
-                    concept_groups[ifc_class][view_name].setdefault(
-                        xmi_concept_name, {"relationships": [], "is_inherited": is_inherited}
-                    )
-                    concept_groups[ifc_class][view_name][xmi_concept_name]["relationships"].append(xmi_relationship)
+            concept_groups.setdefault(ifc_class, {})
+            concept_groups[ifc_class].setdefault(view_name, {})
+            concept_groups[ifc_class][view_name][xmi_concept_name] = {"is_inherited": is_inherited}
 
     # With this "simpler" concept_groups nested dict, let's build the necessary data structure for the template
     # Let's start by walking through the inherited classes
@@ -1450,7 +1611,7 @@ def get_concept_usage(resource, builder, mdc):
 
     if [g for g in groups if g["total_concepts"]]:
         return {
-            "number": SectionNumberGenerator.generate(),
+            "number": X.section_numbers.generate(),
             "groups": groups,
             "total_inherited_concepts": total_inherited_concepts,
         }
@@ -1471,7 +1632,7 @@ def get_examples(resource):
             }
         )
     if examples:
-        return {"number": SectionNumberGenerator.generate(), "examples": examples}
+        return {"number": X.section_numbers.generate(), "examples": examples}
 
 
 def get_adoption(resource):
@@ -1491,39 +1652,34 @@ def get_adoption(resource):
                 support = "partially-supported"
             versions.append({"name": f"V1.{j}", "support": support})
         softwares.append({"name": f"Software {i+1}", "versions": reversed(versions)})
-    return {"number": SectionNumberGenerator.generate(), "softwares": softwares}
+    return {"number": X.section_numbers.generate(), "softwares": softwares}
 
 
 def get_formal_representation(resource):
     express = R.entity_definitions.get(resource)
     if express:
-        return {"number": SectionNumberGenerator.generate(), "express": express}
+        return {"number": X.section_numbers.generate(), "express": express}
 
 
 def get_references(resource):
-    references = set()
-    for ifc_entity, express in R.entity_definitions.items():
-        if ifc_entity == resource:
-            continue
-        if resource in re.split('[^a-zA-Z]', express):
-            references.add(ifc_entity)
+    references = R.entity_references.get(resource)
     if references:
-        return {"number": SectionNumberGenerator.generate(), "references": sorted(list(references))}
+        return {"number": X.section_numbers.generate(), "references": references}
 
 
 def get_changelog(resource):
     changelog_data = R.changes_by_type.get(resource, {})
     if not changelog_data:
         return
-    changelog = {"number": SectionNumberGenerator.generate(), "sections": []}
-    SectionNumberGenerator.begin_subsection()
+    changelog = {"number": X.section_numbers.generate(), "sections": []}
+    X.section_numbers.begin_subsection()
     for section, changes in changelog_data.items():
         if X.is_iso:
             section = "ISO 16739-1:2023"
         changelog["sections"].append(
             {
                 "name": section,
-                "number": SectionNumberGenerator.generate(),
+                "number": X.section_numbers.generate(),
                 "changes": [
                     {
                         "is_addition": "add" in c[0],
@@ -1536,19 +1692,20 @@ def get_changelog(resource):
                 ],
             }
         )
-    SectionNumberGenerator.end_subsection()
+    X.section_numbers.end_subsection()
     return changelog
 
 
 class FigureNumberer:
-    index = {}
+    """
+    The numbers generated for the figures and tables of a single page.
+    """
 
-    @classmethod
-    def clear(cls):
-        cls.index = {}
+    def __init__(self):
+        self.index = {}
+        self.pattern = None
 
-    @classmethod
-    def generate(cls, figure, number):
+    def generate(self, figure, number):
         previous_header = None
         previous = figure
         parent_number = None
@@ -1574,49 +1731,53 @@ class FigureNumberer:
         alphabet = "A"
         generate_number = lambda: ((parent_number + ".") if parent_number is not None else "") + alphabet
         generated_number = generate_number()
-        while generated_number in cls.index.values():
+        while generated_number in self.index.values():
             alphabet = chr(ord(alphabet) + 1)
             generated_number = generate_number()
-        cls.index[number] = generated_number
+        self.index[number] = generated_number
+        self.pattern = None
 
-    @classmethod
-    def replace_references(cls, html):
+    def replace_references(self, html):
         # We replace references using a simple string replacement, so the
         # placeholder "X" in "Figure X" gets replaced with the actual generated
         # number based on the section.
         # String replacing can be ambiguous, for example if there is both a
         # "Figure 1" and "Figure 10" it may accidentally replace the latter.
-        # As a result with do string replacements in reverse order of the length
-        # of the placeholder number.
-        for placeholder_number, generated_number in sorted(cls.index.items(), key=lambda x: len(x[0]), reverse=True):
-            html = html.replace(f"Figure {placeholder_number}", f"Figure {generated_number}")
-            html = html.replace(f"Figure-{placeholder_number}", f"Figure-{generated_number}")
-            html = html.replace(f"Table {placeholder_number}", f"Table {generated_number}")
-            html = html.replace(f"Table-{placeholder_number}", f"Table-{generated_number}")
-        return html
+        # As a result the alternatives in the pattern are ordered in reverse
+        # order of the length of the placeholder number. All placeholders are
+        # substituted in a single pass, so that generated numbers are never
+        # substituted again.
+        if not self.index:
+            return html
+        if self.pattern is None:
+            placeholders = sorted(self.index.keys(), key=len, reverse=True)
+            self.pattern = re.compile("(Figure|Table)([ -])(%s)" % "|".join(map(re.escape, placeholders)))
+        return self.pattern.sub(lambda m: m.group(1) + m.group(2) + self.index[m.group(3)], html)
 
 
 class SectionNumberGenerator:
-    number = "1"
+    """
+    The section numbers of the page being rendered, an instance per request
+    in X.section_numbers.
+    """
 
-    @classmethod
-    def set(cls, number):
-        cls.number = number
+    def __init__(self, number="1"):
+        self.number = number
 
-    @classmethod
-    def generate(cls):
-        numbers = cls.number.split(".")
+    def set(self, number):
+        self.number = number
+
+    def generate(self):
+        numbers = self.number.split(".")
         numbers[-1] = str(int(numbers[-1]) + 1)
-        cls.number = ".".join(numbers)
-        return cls.number
+        self.number = ".".join(numbers)
+        return self.number
 
-    @classmethod
-    def begin_subsection(cls):
-        cls.number += ".0"
+    def begin_subsection(self):
+        self.number += ".0"
 
-    @classmethod
-    def end_subsection(cls):
-        cls.number = ".".join(cls.number.split(".")[0:-1])
+    def end_subsection(self):
+        self.number = ".".join(self.number.split(".")[0:-1])
 
 
 @app.route(make_url("annex-b.html"))
@@ -1624,87 +1785,70 @@ def annex_b():
     return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_navigation, body_class='annex')
 
 
-@app.route(make_url("annex-b1.html"))
-def annex_b1():
-    def get_mvd_qualification(resource):
-        mvds = [{'abbr': "".join(re.findall('[A-Z]|(?<=-)[a-z]', k)), 'cause': v.get(resource), 'on': resource in v} for k, v in R.mvd_entity_usage.items()]
-        return mvds
+def annex_b_items(names, numbered=True):
+    return [
+        {"number": name_to_number()[n] if numbered else "", "url": url_for("resource", resource=n), "name": n}
+        for n in names
+    ]
 
-    def get_product_qualification(resource):
-        is_product_or_type = False
-        entity = resource
-        while entity:
-            entity = R.entity_supertype.get(entity)
-            if entity in ("IfcProduct", "IfcTypeProduct"):
-                is_product_or_type = True
-                break
-        return is_product_or_type
 
-    items = [
-        {
-            "number": name_to_number()[n],
-            "url": url_for("resource", resource=n),
-            "name": n,
-            **({} if X.is_iso else {"mvds": get_mvd_qualification(n), "is_product_or_type": get_product_qualification(n)})
-        }
-        for n in entity_names()
+def qualified_entity_items(hierarchy, mvd_entity_usage, entity_supertype):
+    mvds = schema_index.mvd_qualification(hierarchy, mvd_entity_usage)
+    products = schema_index.product_or_type(hierarchy, entity_supertype)
+    return [
+        dict(item, mvds=mvds[item["name"]], is_product_or_type=products[item["name"]])
+        for item in annex_b_entities()
     ]
+
+
+# The listings of the Annex B pages, built on the first request after the resources are (re)loaded
+annex_b_entities = versioned(lambda hierarchy: annex_b_items(entity_names()), R.hierarchy)
+annex_b_qualified_entities = versioned(qualified_entity_items, R.hierarchy, R.mvd_entity_usage, R.entity_supertype)
+annex_b_types = versioned(lambda hierarchy: annex_b_items(type_names()), R.hierarchy)
+annex_b_psets = versioned(lambda psets, hierarchy: annex_b_items(n for n in sorted(psets.keys()) if n in name_to_number()), R.pset_definitions, R.hierarchy)
+annex_b_properties = versioned(
+    lambda psets: [{"number": "", "url": url_for("property", prop=n), "name": n} for n in schema_index.property_names(psets)],
+    R.pset_definitions,
+)
+annex_b_functions = versioned(lambda hierarchy: annex_b_items(function_names(), numbered=False), R.hierarchy)
+annex_b_rules = versioned(lambda hierarchy: annex_b_items(rule_names(), numbered=False), R.hierarchy)
+annex_b_propertyenumerations = versioned(lambda hierarchy: annex_b_items(propertyenumeration_names(), numbered=False), R.hierarchy)
+
+
+@app.route(make_url("annex-b1.html"))
+def annex_b1():
+    items = annex_b_entities() if X.is_iso else annex_b_qualified_entities()
     return render_template("annex-b.html", navigation=get_navigation(), items=items, is_dictionary=True, title="Entities", body_class='annex')
 
 
 @app.route(make_url("annex-b2.html"))
 def annex_b2():
-    items = [
-        {"number": name_to_number()[n], "url": url_for("resource", resource=n), "name": n}
-        for n in type_names()
-    ]
-    return render_template("annex-b.html", navigation=get_navigation(), items=items, is_dictionary=True, title="Types", body_class='annex')
+    return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_types(), is_dictionary=True, title="Types", body_class='annex')
 
 
 @app.route(make_url("annex-b3.html"))
 def annex_b3():
-    items = [
-        {"number": name_to_number()[n], "url": url_for("resource", resource=n), "name": n}
-        for n in sorted(R.pset_definitions.keys())
-        if n in name_to_number()
-    ]
-    return render_template("annex-b.html", navigation=get_navigation(), items=items, is_dictionary=True, title="Property sets", body_class='annex')
+    return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_psets(), is_dictionary=True, title="Property sets", body_class='annex')
 
 
 @app.route(make_url("annex-b4.html"))
 def annex_b4():
-    items = [
-        {"number": "", "url": url_for("property", prop=n), "name": n}
-        for n in sorted(set([p["name"] for pdef in R.pset_definitions.values() for p in pdef["properties"]]))
-    ]
-    return render_template("annex-b.html", navigation=get_navigation(), items=items, title="Properties", body_class='annex')
+    return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_properties(), title="Properties", body_class='annex')
 
 
 @app.route(make_url("annex-b5.html"))
 def annex_b5():
-    items = [
-        {"number": "", "url": url_for("resource", resource=n), "name": n}
-        for n in function_names()
-    ]
-    return render_template("annex-b.html", navigation=get_navigation(), items=items, title="Functions", body_class='annex')
+    return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_functions(), title="Functions", body_class='annex')
 
 
 @app.route(make_url("annex-b6.html"))
 def annex_b6():
-    items = [
-        {"number": "", "url": url_for("resource", resource=n), "name": n}
-        for n in rule_names()
-    ]
-    return render_template("annex-b.html", navigation=get_navigation(), items=items, title="Rules", body_class='annex')
+    return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_rules(), title="Rules", body_class='annex')
 
 
 @app.route(make_url("annex-b7.html"))
 def annex_b7():
-    items = [
-        {"number": "", "url": url_for("resource", resource=n), "name": n}
-        for n in propertyenumeration_names()
-    ]
-    return render_template("annex-b.html", navigation=get_navigation(), items=items, title="Property Enumerations", body_class='annex')
+    return render_template("annex-b.html", navigation=get_navigation(), items=annex_b_propertyenumerations(), title="Property Enumerations", body_class='annex')
 
 
 def make_concept(path, number_path=None, exclude_partial=True):
@@ -1966,7 +2110,7 @@ def annex_a():
 
 @app.route(make_url("annex-a-express.html"))
 def annex_a_express():
-    return render_template("annex-a-express.html", navigation=get_navigation(), express=open("IFC.exp").read(), link=f"{SCHEMA_NAME}.exp", body_class='annex')
+    return render_template("annex-a-express.html", navigation=get_navigation(), express=open(R.path("IFC.exp")).read(), link=f"{SCHEMA_NAME}.exp", body_class='annex')
 
 
 @app.route(make_url("annex-a-xsd.html"))
@@ -1979,12 +2123,12 @@ def annex_a_xsd():
 def annex_a_schema_download():
     fn = os.path.basename(request.path)
     kwarg = 'attachment_filename' if flask.__version__ < '2' else 'download_name'
-    return send_file(f"IFC.{fn.rsplit('.', 1)[1]}", as_attachment=True, **{kwarg: fn})
+    return send_file(R.path(f"IFC.{fn.rsplit('.', 1)[1]}"), as_attachment=True, **{kwarg: fn})
 
 
 @app.route(make_url("annex-a-psd.zip"))
 def annex_a_psd():
-    return send_file("psd.zip")
+    return send_file(R.path("psd.zip"))
 
 
 def annotate_hierarchy(data=None, start=1, number_path=None):
@@ -2039,7 +2183,7 @@ def toc():
 def annex_c():
     entities = []
     indentation_map = {0: entities}
-    with open("inheritance_listing.txt") as inheritance_listings:
+    with open(R.path("inheritance_listing.txt")) as inheritance_listings:
         for line in inheritance_listings:
             line = line.strip("\n")
             padding = line.count(" ")
@@ -2133,10 +2277,10 @@ def annex_f():
     # html = ""
     _, __, ___, html = get_content_html("changelog", require_number=False)
 
-    with open("changes_by_schema.json") as f:
+    with open(R.path("changes_by_schema.json")) as f:
         changelog_data = json.load(f)
         changelog = {"sections": []}
-        SectionNumberGenerator.begin_subsection()
+        X.section_numbers.begin_subsection()
         for section in changelog_data:
             if X.is_iso:
                 section_name = "F.1 - ISO 16739-1:2023 to ISO 16739:2018 change log"
@@ -2160,7 +2304,7 @@ def annex_f():
                     ],
                 }
             )
-        SectionNumberGenerator.end_subsection()
+        X.section_numbers.end_subsection()
     return render_template("annex-f.html", definition=html, navigation=get_navigation(), changelogs=changelog, body_class='annex')
 
 
@@ -2240,12 +2384,12 @@ def schema(name):
     n = f"{n1}.{n2}"
     fn = os.path.join(md_root, cat, t, "README.md")
 
-    SectionNumberGenerator.set(n)
-    SectionNumberGenerator.begin_subsection()
+    X.section_numbers.set(n)
+    X.section_numbers.begin_subsection()
 
     definition = None
     if os.path.exists(fn):
-        definition_number = SectionNumberGenerator.generate()
+        definition_number = X.section_numbers.generate()
         definition = process_markdown("", open(fn).read())
 
     order = ["Types", "Entities", "Property Sets", "Quantity Sets", "Functions", "Rules", "PropertyEnumerations"]
@@ -2336,192 +2480,343 @@ try:
 except:
     redis = None
 
+# Entries for the listings of references, figures and tables are pushed to
+# redis while serving, or gathered in-process when pages are pre-rendered.
+listing_collector = None
+
+
+def record_listing(kind, entry):
+    if listing_collector is not None:
+        listing_collector[kind].append(entry)
+    if redis:
+        try:
+            redis.lpush(kind, json.dumps(entry))
+        except ConnectionError:
+            pass
+
+
+def write_listings(entries_by_kind):
+    for x in "references,figures,tables".split(","):
+        with open(f"listing_{x}.json", "w") as f:
+            json.dump(
+                [
+                    {"number": p[1], "url": p[2], "title": p[0]}
+                    for p in sorted(set(map(tuple, entries_by_kind.get(x, ()))))
+                ],
+                f,
+            )
+
+
+class identifier_linker:
+    """
+    Decorates IFC identifiers in text nodes with links to their definition.
+
+    Entity names are matched case-insensitively, property set and type names
+    exactly. The name index is only rebuilt when one of the underlying schema
+    resources has been reloaded.
+    """
+
+    excluded_tags = ("a", "title", "script", "style")
+
+    def __init__(self, entities, psets, types):
+        self.resources = entities, psets, types
+        self.versions = None
+        self.by_folded_name = {}
+        self.by_name = {}
+
+    def update(self):
+        versions = tuple(r.version() for r in self.resources)
+        if versions == self.versions:
+            return
+        entities, psets, types = self.resources
+        self.by_folded_name = {k.upper(): k for k in entities.keys()}
+        psets_folded = {k.upper(): k for k in psets.keys()}
+        self.by_name = {k: psets_folded.get(k.upper(), k) for k in itertools.chain(psets.keys(), types.keys())}
+        self.versions = versions
+
+    def resolve(self, w):
+        return self.by_folded_name.get(w.upper()) or self.by_name.get(w)
+
+    def link(self, soup, node):
+        text = str(node)
+        pieces = []
+        pos = 0
+        for m in ifcre.finditer(text):
+            w = m.group(0)
+            if node.next_sibling is None and not text[m.end():].strip() and node.parent.name[0] in "ah":
+                # The regex used to run on serialized markup with a lookahead for
+                # `\s*</a` and `\s*</h`, i.e. names that directly close an element
+                # starting with those letters (such as the h1 title) are not linked.
+                continue
+            name = self.resolve(w)
+            if name is None:
+                continue
+            record_listing("references", [name, "", request.path])
+            a = soup.new_tag("a", href=url_for("resource", resource=name))
+            a.string = w
+            pieces.append(text[pos:m.start()])
+            pieces.append(a)
+            pos = m.end()
+        if pieces:
+            pieces.append(text[pos:])
+            # Tag.insert_before() looks up the position in the parent for
+            # every call, which is quadratic for long listings.
+            parent = node.parent
+            i = parent.index(node)
+            node.extract()
+            for p in filter(None, pieces):
+                parent.insert(i, p)
+                i += 1
+
+
+linker = identifier_linker(R.entity_definitions, R.pset_definitions, R.type_values)
+
+
+def preload():
+    """
+    Loads the schema resources and the indices derived from them up front,
+    in the gunicorn master process so that forked workers share them (see
+    gunicorn.conf.py).
+    """
+    R.load()
+    try:
+        inheritance.update()
+        linker.update()
+    except werkzeug.exceptions.HTTPException:
+        pass
+
+
+# Fully rendered pages can be cached, as they only depend on the git HEAD of
+# the repository and the generated resources in the working directory. The
+# cache is opt-in because local edits to the Markdown are not detected.
+# PAGE_CACHE=memory|disk|redis, PAGE_CACHE_SIZE in MB
+page_cache_kind = os.environ.get("PAGE_CACHE")
+page_cache_size = int(os.environ.get("PAGE_CACHE_SIZE", "512")) * 1024 * 1024
+if page_cache_kind == "memory":
+    page_cache = memory_page_cache(page_cache_size)
+elif page_cache_kind == "disk":
+    page_cache = disk_page_cache(os.environ.get("PAGE_CACHE_DIR", "page_cache"), page_cache_size)
+elif page_cache_kind == "redis" and redis:
+    page_cache = redis_page_cache(redis, page_cache_size)
+else:
+    page_cache = None
+
+page_cache_dependencies = [r.path for r in R.resources()] + ["IFC.exp", "changes_by_schema.json", "inheritance_listing.txt"]
+
+
+def is_page(path):
+    return path == "/" or path.endswith(".htm") or path.endswith(".html")
+
+
+def get_page_cache_key():
+    if page_cache is None or request.method != "GET" or not is_page(request.path):
+        return None
+    return make_key(request.path, X.is_iso, X.is_package, fingerprint(map(R.path, page_cache_dependencies), REPO_DIR))
+
 
 @app.before_request
 def before():
+    R.refresh()
+    X.section_numbers = SectionNumberGenerator()
+
     X.is_iso = request.args.get("iso") == "1" if "iso" in request.args else is_iso
     X.is_package = request.args.get("package") == "1" if "package" in request.args else is_package
 
-@app.after_request
-def after(response):
-    # listing is too slow
-    if (request.path.endswith(".htm") or request.path.endswith(".html")) and not request.path.endswith('listing-references.html'):
-        FigureNumberer.clear()
+    X.page_cache_key = get_page_cache_key()
+    if X.page_cache_key:
+        data = page_cache.get(X.page_cache_key)
+        if data is not None:
+            X.page_cache_hit = True
+            return flask.Response(data, mimetype="text/html")
 
-        html = response.data.decode("utf-8")
 
-        # I know, I know, string to dom to string to dom to ...
-        soup = BeautifulSoup(html)
+def number_figures(soup, main_content, numberer):
+    for img in main_content.findAll(["img", "svg"]):
+        # Capture images as numbered figures
+        parent = img.parent
+        if parent is None:
+            continue
+        if parent.name == "td":
+            p = soup.new_tag("p")
+            p.append(img.extract())
+            parent.append(p)
+            parent = p
+        elif parent.name == "a":
+            parent = parent.parent
+        parent.name = "figure"
+        has_caption = False
+        sibling = parent.find_next_sibling()
+        if parent.text.strip() and parent.text.strip().startswith("Figure"):
+            # Option 1: the figure caption is in the same block as the image
+            has_caption = True
+            figcaption = soup.new_tag("figcaption")
+            figcaption.string = parent.text
+            extracted_img = img.extract()
+            parent.string = ""
+            parent.append(extracted_img)
+            parent.append(figcaption)
+            numberer.generate(parent, figcaption.text.split(" ", 2)[1])
+        elif sibling and sibling.name == "p" and sibling.text.startswith("Figure"):
+            # Option 2: the figure caption is in the next block
+            has_caption = True
+            figcaption = sibling.extract()
+            figcaption.name = "figcaption"
+            parent.append(figcaption)
+            numberer.generate(parent, figcaption.text.split(" ", 2)[1])
+        elif img.get("title", "").strip():
+            # Option 3: the image has a "title" tag being (ab)used as a caption
+            # Not very nice, as the title in HTML is not the same as the figcaption
+            # This is lazy captioning :)
+            has_caption = True
+            figcaption = soup.new_tag("figcaption")
+            figcaption.string = img["title"].strip()
+            parent.append(figcaption)
+            numberer.generate(parent, figcaption.text.split(" ", 2)[1])
+        if not has_caption:
+            figcaption = soup.new_tag("figcaption")
+            token = str(uuid.uuid4())
+            figcaption.string = "Figure " + token
+            parent.append(figcaption)
+            numberer.generate(parent, token)
+
+    for table in main_content.findAll("table"):
+        figure = soup.new_tag("figure")
+        table.insert_before(figure)
+        figure.append(table.extract())
+        parent = figure
+        has_caption = False
+
+        sibling = parent.find_next_sibling()
+        if sibling and sibling.name == "p" and sibling.text.startswith("Table"):
+            has_caption = True
+            figcaption = sibling.extract()
+            figcaption.name = "figcaption"
+            parent.append(figcaption)
+            numberer.generate(parent, figcaption.text.split(" ", 2)[1])
+
+        if not has_caption:
+            figcaption = soup.new_tag("figcaption")
+            token = str(uuid.uuid4())
+            figcaption.string = "Table " + token
+            parent.append(figcaption)
+            numberer.generate(parent, token)
+
+
+def insert_anchors(soup):
+    for element in soup.findAll(["h2", "h3", "h4", "h5", "h6", "figure"]):
+        id_element = element
+
+        divs = element.find_all("div")
+        if element.name[0] == "h" and len(divs) == 2 and 'number' in divs[0]['class']:
+            # terms and defs
+            anchor_tag = divs[1].text.strip()
+        else:
+            if element.name == "figure":
+                element = element.findChild("figcaption", recursive=False)
+                value = element.text.strip()
+            else:
+                value = element.text.strip()
+
+            anchor_tag = re.sub("[^0-9a-zA-Z.]+", "-", value)
+
+        anchor_id = soup.new_tag("a")
+        anchor_id["id"] = anchor_tag
+        anchor_id["class"] = "anchor"
+        id_element.insert(0, anchor_id)
+
+        anchor = soup.new_tag("a")
+        anchor["href"] = "#" + anchor_tag
+        anchor["class"] = "link"
+        icon = soup.new_tag("i")
+        icon["data-feather"] = "link"
+        anchor.append(icon)
+        element.append(anchor)
+
+
+def rewrite_document(soup, linker, numberer):
+    # A single walk over the tree that substitutes the generated figure and
+    # table numbers in text and attribute values (ids and hrefs of anchors)
+    # and decorates IFC names in text with links. Whether text is eligible
+    # for linking is tracked while descending, attribute values are never
+    # decorated.
+    replace_references = numberer.replace_references
+
+    def visit(tag, linkable):
+        for node in list(tag.children):
+            if isinstance(node, bs4.Tag):
+                for k, v in node.attrs.items():
+                    if isinstance(v, str):
+                        node[k] = replace_references(v)
+                visit(node, linkable and node.name not in linker.excluded_tags)
+            elif type(node) is bs4.NavigableString:
+                text = replace_references(node)
+                if text != node:
+                    new_node = bs4.NavigableString(text)
+                    node.replace_with(new_node)
+                    node = new_node
+                if linkable:
+                    linker.link(soup, node)
+
+    visit(soup, True)
+
+
+def postprocess_html(html):
+    """
+    Numbers figures and tables, inserts heading anchors and decorates IFC
+    names with links in a single parse of the rendered page. Returns None
+    when the page does not have a title heading.
+    """
+    numberer = FigureNumberer()
 
-        try:
-            h1 = soup.findAll("h1")[0]
-        except:
-            return response
+    soup = BeautifulSoup(html)
 
-        title = soup.findAll("title")[0]
-        title.string = title_string = h1.text + " - " + title.string
+    try:
+        h1 = soup.findAll("h1")[0]
+    except:
+        return None
 
-        main_content = soup.find_all(id="main-content")
-        main_content = main_content[0] if len(main_content) else None
+    title = soup.findAll("title")[0]
+    title.string = h1.text + " - " + title.string
 
-        if main_content:
-            for img in main_content.findAll(["img", "svg"]):
-                # Capture images as numbered figures
-                parent = img.parent
-                if parent is None:
-                    continue
-                if parent.name == "td":
-                    p = soup.new_tag("p")
-                    p.append(img.extract())
-                    parent.append(p)
-                    parent = p
-                elif parent.name == "a":
-                    parent = parent.parent
-                parent.name = "figure"
-                has_caption = False
-                sibling = parent.find_next_sibling()
-                if parent.text.strip() and parent.text.strip().startswith("Figure"):
-                    # Option 1: the figure caption is in the same block as the image
-                    has_caption = True
-                    figcaption = soup.new_tag("figcaption")
-                    figcaption.string = parent.text
-                    extracted_img = img.extract()
-                    parent.string = ""
-                    parent.append(extracted_img)
-                    parent.append(figcaption)
-                    FigureNumberer.generate(parent, figcaption.text.split(" ", 2)[1])
-                elif sibling and sibling.name == "p" and sibling.text.startswith("Figure"):
-                    # Option 2: the figure caption is in the next block
-                    has_caption = True
-                    figcaption = sibling.extract()
-                    figcaption.name = "figcaption"
-                    parent.append(figcaption)
-                    FigureNumberer.generate(parent, figcaption.text.split(" ", 2)[1])
-                elif img.get("title", "").strip():
-                    # Option 3: the image has a "title" tag being (ab)used as a caption
-                    # Not very nice, as the title in HTML is not the same as the figcaption
-                    # This is lazy captioning :)
-                    has_caption = True
-                    figcaption = soup.new_tag("figcaption")
-                    figcaption.string = img["title"].strip()
-                    parent.append(figcaption)
-                    FigureNumberer.generate(parent, figcaption.text.split(" ", 2)[1])
-                if not has_caption:
-                    figcaption = soup.new_tag("figcaption")
-                    token = str(uuid.uuid4())
-                    figcaption.string = "Figure " + token
-                    parent.append(figcaption)
-                    FigureNumberer.generate(parent, token)
-
-            for table in main_content.findAll("table"):
-                figure = soup.new_tag("figure")
-                table.insert_before(figure)
-                figure.append(table.extract())
-                parent = figure
-                has_caption = False
-
-                sibling = parent.find_next_sibling()
-                if sibling and sibling.name == "p" and sibling.text.startswith("Table"):
-                    has_caption = True
-                    figcaption = sibling.extract()
-                    figcaption.name = "figcaption"
-                    parent.append(figcaption)
-                    FigureNumberer.generate(parent, figcaption.text.split(" ", 2)[1])
-
-                if not has_caption:
-                    figcaption = soup.new_tag("figcaption")
-                    token = str(uuid.uuid4())
-                    figcaption.string = "Table " + token
-                    parent.append(figcaption)
-                    FigureNumberer.generate(parent, token)
-
-        for element in soup.findAll(["h2", "h3", "h4", "h5", "h6", "figure"]):
-            id_element = element
-
-            divs = element.find_all("div")
-            if element.name[0] == "h" and len(divs) == 2 and 'number' in divs[0]['class']:
-                # terms and defs
-                anchor_tag = divs[1].text.strip()
-            else:
-                if element.name == "figure":
-                    element = element.findChild("figcaption", recursive=False)
-                    value = element.text.strip()
-                else:
-                    value = element.text.strip()
+    main_content = soup.find_all(id="main-content")
+    main_content = main_content[0] if len(main_content) else None
 
-                anchor_tag = re.sub("[^0-9a-zA-Z.]+", "-", value)
+    if main_content:
+        number_figures(soup, main_content, numberer)
 
-            anchor_id = soup.new_tag("a")
-            anchor_id["id"] = anchor_tag
-            anchor_id["class"] = "anchor"
-            id_element.insert(0, anchor_id)
+    insert_anchors(soup)
 
-            anchor = soup.new_tag("a")
-            anchor["href"] = "#" + anchor_tag
-            anchor["class"] = "link"
-            icon = soup.new_tag("i")
-            icon["data-feather"] = "link"
-            anchor.append(icon)
-            element.append(anchor)
+    linker.update()
+    rewrite_document(soup, linker, numberer)
 
-        html = FigureNumberer.replace_references(str(soup))
-        
-        @lru_cache()
-        def case_norm(v):
-            x = v.upper()
-            n = {k.upper():k for k in R.entity_definitions.keys()}.get(x)
-            if n: return n
-            n = {k.upper():k for k in R.pset_definitions.keys()}.get(x)
-            if n: return n
-            return v
-
-        def decorate_link(m):
-            w = m.group(0)
-            fragment_reversed = html[0:m.span()[0]][::-1]
-            title_start = fragment_reversed.find('"=eltit')
-            quotes_before = [i for i,c in enumerate(fragment_reversed[0:title_start]) if c == '"']
-            if title_start != -1 and len(quotes_before) == 0:
-                # we're in a title="..." attribute
-                return w
-            
-            if w.upper() in [k.upper() for k in R.entity_definitions.keys()] or w in R.pset_definitions or w in R.type_values:
-                if redis:
-                    try:
-                        redis.lpush("references", json.dumps([case_norm(w), "", request.path]))
-                    except ConnectionError:
-                        pass
-                return "<a href='" + url_for("resource", resource=case_norm(w)) + "'>" + w + "</a>"
+    for elem in soup.findAll("figure"):
+        if elem.figcaption:
+            is_image = bool(elem.img) or bool(elem.svg)
+            if "\u2014" in elem.figcaption.text:
+                label, caption = map(str.strip, elem.figcaption.text.split("\u2014", 1))
+            elif elem.img:
+                label = elem.figcaption.text.strip()
+                caption = elem.img.get("alt", "").strip()
             else:
-                return w
+                continue
+            record_listing("figures" if is_image else "tables", [caption or "unnamed", label, request.path])
 
-        # @todo we really shouldn't be using regex for this, but a proper html parser
-        html = ifcre.sub(decorate_link, html)
-        soup = BeautifulSoup(html)
+    return str(soup)
 
-        for elem in soup.findAll("figure"):
-            if elem.figcaption:
-                is_image = bool(elem.img) or bool(elem.svg)
-                if "\u2014" in elem.figcaption.text:
-                    label, caption = map(str.strip, elem.figcaption.text.split("\u2014", 1))
-                elif elem.img:
-                    label = elem.figcaption.text.strip()
-                    caption = elem.img.get("alt", "").strip()
-                else:
-                    continue
-                if redis:
-                    try:
-                        redis.lpush(
-                            "figures" if is_image else "tables", json.dumps([caption or "unnamed", label, request.path])
-                        )
-                    except ConnectionError:
-                        pass
-        
-        # Restore the original title because we don't want it
-        # with decorated links
-        title = soup.findAll("title")[0]
-        title.string = title_string
 
-        response.data = str(soup)
+@app.after_request
+def after(response):
+    if X.get("page_cache_hit"):
+        return response
+
+    # listing is too slow
+    if (request.path.endswith(".htm") or request.path.endswith(".html")) and not request.path.endswith('listing-references.html'):
+        html = postprocess_html(response.data.decode("utf-8"))
+        if html is not None:
+            response.data = html
+
+    if X.get("page_cache_key") and response.status_code == 200:
+        page_cache.put(X.page_cache_key, response.get_data())
 
     return response
 
@@ -2582,13 +2877,8 @@ if redis:
 
     @app.route("/build_index", methods=["GET", "POST"])
     def build_index():
-        for x in "references,figures,tables".split(","):
-            with open(f"listing_{x}.json", "w") as f:
-                json.dump(
-                    [
-                        {"number": p[1], "url": p[2], "title": p[0]}
-                        for p in sorted(set(map(tuple, map(json.loads, redis.lrange(x, 0, -1)))))
-                    ],
-                    f,
-                )
+        write_listings({
+            x: list(map(json.loads, redis.lrange(x, 0, -1)))
+            for x in "references,figures,tables".split(",")
+        })
         return "OK"
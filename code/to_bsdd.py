@@ -5,7 +5,7 @@ import logging
 import sys
 from collections import defaultdict
 from datetime import date
-from xmi_document import xmi_document, missing_markdown
+from xmi_document import xmi_document, missing_markdown, get_path
 from measure_mapping import MEASURE_MAPPING
 from name_improve import name_improve, definition_improve
 from tqdm import tqdm
@@ -48,28 +48,6 @@ TYPE_TO_VALUES = {
 # schema_name = schema_name.strip('_')
 
 
-def yield_parents(node):
-    """Find all the parent elements if available"""
-    yield node
-    if node.parentNode:
-        yield from yield_parents(node.parentNode)
-
-
-def get_path(xmi_node):
-    """Find the element's path in the XML tree"""
-    nodes = list(yield_parents(xmi_node.xml))
-
-    def get_name(n):
-        """Find element's name in the XML"""
-        if n.attributes:
-            v = n.attributes.get("name")
-            if v:
-                return v.value
-
-    node_names = [get_name(n) for n in nodes]
-    return node_names[::-1]
-
-
 # included_packages = set(("IFC 4.2 schema (13.11.2019)", "Common Schema",
 # "IFC Ports and Waterways", "IFC Road", "IFC Rail - PSM"))
 
@@ -23,7 +23,7 @@ except:
     print("       writes converted Express schema to stdout", file=sys.stderr)
     exit()
     
-xmi = xmi.doc(fn)
+xmi = xmi.load(fn)
 
 connector_data = namedtuple("connector_data", ("is_inverse", "inverse_order", "aggregation_type", "is_optional"))
 assocation_data = namedtuple("assocation_data", ("own_end", "type", "other_end", "asssocation"))
@@ -2,11 +2,12 @@ import os
 import sys
 import glob
 
-ifn, ofn = sys.argv[1:]
+# Optionally followed by the Markdown files to transform, by default all files in the input directory
+ifn, ofn, *fns = sys.argv[1:]
 
 from xml.etree.ElementTree import Element, SubElement, tostring
 
-for fn in glob.glob(os.path.join(ifn, "**", "*.md"), recursive=True):
+for fn in fns or glob.glob(os.path.join(ifn, "**", "*.md"), recursive=True):
     add = Element('add')
     top = SubElement(add, 'doc')
 
@@ -1,22 +1,37 @@
+import os
 import re
 import io
+import gc
+import sys
+import html
+import glob
 import bisect
+import pickle
+import hashlib
+import tempfile
+import functools
 
 from xml.dom import minidom
+from xml.parsers import expat
 from collections import defaultdict
 
 class base(object):
+    __slots__ = ()
+
     def child_with_tag_recursive(self, other):
         if self.xml.tagName == other:
             yield self
         for x in self.children:
             yield from x.child_with_tag_recursive(other)
 
-    def __truediv__(self, other):
+    def descendants_with_tag(self, other):
         return list(self.child_with_tag_recursive(other))
 
+    def __truediv__(self, other):
+        return list(self.descendants_with_tag(other))
+
     def __or__(self, other):
-        li = self/other
+        li = self.descendants_with_tag(other)
         if len(li) != 1:
             raise ValueError("%s has %d childNodes of type %s" % (self, len(li), other))
         return li[0]
@@ -59,6 +74,193 @@ def get_encoding(fn):
     return d[1]
 
 
+def extract_tags(doc):
+    """
+    Values of the tagged values of stereotypes defined in UML profiles,
+    keyed by stereotype name and base element id.
+    """
+    tags = {}
+
+    for pr in doc.by_tag["uml:Profile"]:
+        for pe in pr / "packagedElement":
+            if pe.xmi_type != "uml:Stereotype":
+                continue
+
+            D = {}
+            tag = f"{pr.id}:{pe.id}".replace(" ", "_")
+            attrs = [a.name for a in pe / "ownedAttribute"]
+            base, attrs = attrs[0], attrs[1:]
+            for tag_def in doc.by_tag[tag]:
+                # it appears EA does not correctly export
+                # profiles with different base types but the
+                # same id / name, so we lookup attribute name
+                # based on XML node
+                base = [k for k in tag_def.attributes() if k.startswith("base_")][0]
+
+                base_val = getattr(tag_def, base)
+                if len(attrs) == 0:
+                    D[base_val] = True
+                elif len(attrs) == 1:
+                    D[base_val] = getattr(tag_def, attrs[0])
+                else:
+                    D[base_val] = tuple(getattr(tag_def, a) for a in attrs)
+
+            # we update because there can be multiple stereotypes for
+            # different kinds of elements, such as ordering info
+            # for assoc, entity and enum literals
+            tags[pe.name] = tags.get(pe.name, {})
+            tags[pe.name].update(D)
+
+    return tags
+
+
+def without_gc(fn):
+    """
+    Suspends the cyclic garbage collector while creating the many element
+    objects of a document, which otherwise repeatedly traverses them all
+    without finding anything to collect.
+    """
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if enabled:
+                gc.enable()
+    return inner
+
+
+def get_attribute(attrib, k):
+    # Same lookup as node.__getattr__: name, xmi:name, then with underscores as colons
+    if k in attrib:
+        return attrib[k]
+    v = attrib.get('xmi:' + k)
+    if v is not None:
+        return v
+    if '_' in k:
+        return get_attribute(attrib, k.replace("_", ":"))
+
+
+class dom_node:
+    """
+    The subset of the xml.dom.minidom node interface that is used on node.xml
+    """
+
+    __slots__ = ("element",)
+
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tagName(self):
+        return self.element._tag
+
+    @property
+    def parentNode(self):
+        p = self.element.parent
+        return dom_node(p) if p is not None else None
+
+    @property
+    def attributes(self):
+        if self.element._tag is None:
+            # The document
+            return None
+        return {k: dom_attribute(k, v) for k, v in self.element._attrib.items()}
+
+    def getAttribute(self, k):
+        return self.element._attrib.get(k, "")
+
+
+class dom_attribute:
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class element(base):
+    """
+    A compact equivalent of node for elements read by doc, which stores the
+    tag name, attributes and position in the file instead of a DOM node.
+    """
+
+    __slots__ = ("parent", "children", "_tag", "_attrib", "_line", "_column", "_index", "_path")
+
+    def __init__(self, tag, attrib, parent, line=0, column=0):
+        self._tag = tag
+        self._attrib = attrib
+        self.parent = parent
+        self.children = []
+        self._line = line
+        self._column = column
+        self._index = None
+        self._path = None
+
+    xml = property(dom_node)
+
+    @property
+    def sourceline(self):
+        return self._line
+
+    def child_with_tag_recursive(self, other):
+        stack = [self]
+        while stack:
+            n = stack.pop()
+            if n._tag == other:
+                yield n
+            stack.extend(reversed(n.children))
+
+    def index(self):
+        """
+        The elements in this subtree (including this element) by tag name, in
+        document order. Built on first use, the tree does not change after
+        loading.
+        """
+        if self._index is None:
+            index = defaultdict(list)
+            stack = [self]
+            while stack:
+                n = stack.pop()
+                index[n._tag].append(n)
+                stack.extend(reversed(n.children))
+            self._index = dict(index)
+        return self._index
+
+    def descendants_with_tag(self, other):
+        if not self.children:
+            return (self,) if self._tag == other else ()
+        return self.index().get(other, ())
+
+    def get_path(self):
+        """
+        The names of the ancestors of this element and of the element itself,
+        from the document down, None for unnamed elements. Cached, so the
+        ancestors are visited once for all of their descendants.
+        """
+        if self._path is None:
+            prefix = self.parent.get_path() if self.parent is not None else ()
+            self._path = prefix + (self._attrib.get("name"),)
+        return self._path
+
+    def tags(self):
+        return dict(map(lambda t: (t.name, t.value), self/"tag"))
+
+    def attributes(self):
+        return dict(self._attrib)
+
+    def __getattr__(self, k):
+        if k.startswith("__") or k in element.__slots__:
+            raise AttributeError(k)
+        return get_attribute(self._attrib, k)
+
+    def __repr__(self):
+        attrs = "".join(' %s="%s"' % (k, html.escape(v)) for k, v in self._attrib.items())
+        return "<%s%s%s>" % (self._tag, attrs, "" if self.children else "/")
+
+
 class doc(base):
     """
     A helper class for easily navigating the DOM.
@@ -70,6 +272,142 @@ class doc(base):
     doc.by_tag_and_type["element"]["uml:DataType"]
     doc.by_id[...] single element by xml:id
     
+    The file is read in a single pass with expat, the index structures are
+    populated while parsing.
+    """
+
+    @without_gc
+    def __init__(self, fn):
+        self.fn = fn
+        self.root = element(None, {}, None)
+        self.xml = self.root.xml
+        self.by_type = defaultdict(list)
+        self.by_tag_and_type = defaultdict(functools.partial(defaultdict, list))
+        self.by_tag = defaultdict(list)
+        self.by_id = dict()
+        self.by_idref = defaultdict(list)
+
+        parser = expat.ParserCreate()
+        stack = [self.root]
+
+        by_type, by_tag, by_tag_and_type = self.by_type, self.by_tag, self.by_tag_and_type
+        by_id, by_idref = self.by_id, self.by_idref
+
+        def start(tag, attrib):
+            parent = stack[-1]
+            e = element(tag, attrib, parent, parser.CurrentLineNumber, parser.CurrentColumnNumber)
+            parent.children.append(e)
+            stack.append(e)
+
+            by_tag[tag].append(e)
+            t = get_attribute(attrib, "type")
+            if t:
+                by_type[t].append(e)
+                by_tag_and_type[tag][t].append(e)
+            t = get_attribute(attrib, "xmi_id")
+            if t and t not in by_id:
+                # note that duplicate xmi:ids do exist e.g. for generalizations
+                by_id[t] = e
+            t = get_attribute(attrib, "xmi_idref")
+            if t:
+                by_idref[t].append(e)
+
+        def end(tag):
+            stack.pop()
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+
+        with open(fn, "rb") as f:
+            parser.ParseFile(f)
+
+        self.tags = extract_tags(self)
+
+    def child_with_tag_recursive(self, other):
+        return self.root.child_with_tag_recursive(other)
+
+    def descendants_with_tag(self, other):
+        # by_tag is populated in document order as well
+        return self.by_tag.get(other, ())
+
+    def __getstate__(self):
+        # Pickled as flat lists with the indexes referring to positions in
+        # document order, which is much faster to load than the element objects
+        elements = self.elements()
+        position = {id(e): i for i, e in enumerate(elements)}
+        pos = lambda li: [position[id(e)] for e in li]
+        return {
+            "elements": [
+                (e._tag, e._attrib, position.get(id(e.parent), -1), e._line, e._column)
+                for e in elements
+            ],
+            "by_type": {k: pos(v) for k, v in self.by_type.items()},
+            "by_tag_and_type": {t: {k: pos(v) for k, v in d.items()} for t, d in self.by_tag_and_type.items()},
+            "by_tag": {k: pos(v) for k, v in self.by_tag.items()},
+            "by_id": {k: position[id(v)] for k, v in self.by_id.items()},
+            "by_idref": {k: pos(v) for k, v in self.by_idref.items()},
+            "tags": self.tags,
+        }
+
+    @without_gc
+    def __setstate__(self, state):
+        # the file name is set by load(), snapshots are shared by identical files
+        self.fn = None
+        self.root = element(None, {}, None)
+        self.xml = self.root.xml
+        elements = []
+        for tag, attrib, parent, line, column in state["elements"]:
+            p = elements[parent] if parent != -1 else self.root
+            e = element(tag, attrib, p, line, column)
+            p.children.append(e)
+            elements.append(e)
+        el = lambda li: [elements[i] for i in li]
+        self.by_type = defaultdict(list, ((k, el(v)) for k, v in state["by_type"].items()))
+        self.by_tag_and_type = defaultdict(functools.partial(defaultdict, list))
+        for t, d in state["by_tag_and_type"].items():
+            self.by_tag_and_type[t] = defaultdict(list, ((k, el(v)) for k, v in d.items()))
+        self.by_tag = defaultdict(list, ((k, el(v)) for k, v in state["by_tag"].items()))
+        self.by_id = {k: elements[i] for k, i in state["by_id"].items()}
+        self.by_idref = defaultdict(list, ((k, el(v)) for k, v in state["by_idref"].items()))
+        self.tags = state["tags"]
+
+    def elements(self):
+        """
+        All elements in document order
+        """
+        result = []
+        stack = list(reversed(self.root.children))
+        while stack:
+            e = stack.pop()
+            result.append(e)
+            stack.extend(reversed(e.children))
+        return result
+
+    @functools.cached_property
+    def text(self):
+        # only read for locate(), not kept in snapshots
+        return open(self.fn, encoding=get_encoding(self.fn)).read()
+
+    @functools.cached_property
+    def linebreaks(self):
+        return [m.span()[0] for m in re.finditer(r'\n', self.text)]
+
+    def locate(self, node):
+        return locate(self.text, self.linebreaks, node)
+
+
+class minidom_doc(base):
+    """
+    A helper class for easily navigating the DOM, the original implementation
+    on top of xml.dom.minidom. See doc for the more efficient equivalent.
+    
+    Examples:
+    
+    doc/"connector" list of elements with connector tagName
+    doc|"start" same as above but single element (this is asserted)
+    doc.by_tag_and_type["element"]["uml:DataType"]
+    doc.by_id[...] single element by xml:id
+    
     """
     
     def __init__(self, fn):
@@ -121,44 +459,101 @@ class doc(base):
             register_by_xmi_idref,
             register_by_tag_and_xmi_type)
             
-        self.tags = {}
-            
-        for pr in self.by_tag["uml:Profile"]:
-            for pe in pr / "packagedElement":
-                if pe.xmi_type != "uml:Stereotype":
-                    continue
-
-                D = {}
-                tag = f"{pr.id}:{pe.id}".replace(" ", "_")
-                attrs = [a.name for a in pe / "ownedAttribute"]
-                base, attrs = attrs[0], attrs[1:]
-                for tag_def in self.by_tag[tag]:
-                    # it appears EA does not correctly export
-                    # profiles with different base types but the
-                    # same id / name, so we lookup attribute name
-                    # based on XML node
-                    base = [k for k in tag_def.attributes() if k.startswith("base_")][0]
-                    
-                    base_val = getattr(tag_def, base)
-                    if len(attrs) == 0:
-                        D[base_val] = True
-                    elif len(attrs) == 1:
-                        D[base_val] = getattr(tag_def, attrs[0])
-                    else:
-                        D[base_val] = tuple(getattr(tag_def, a) for a in attrs)
-                
-                # we update because there can be multiple stereotypes for
-                # different kinds of elements, such as ordering info
-                # for assoc, entity and enum literals
-                self.tags[pe.name] = self.tags.get(pe.name, {})
-                self.tags[pe.name].update(D)
+        self.tags = extract_tags(self)
 
     
     def locate(self, node):
-        # pat = r'(?<=<)(%s[^\\/]*?xmi:idref="%s"[^\\/]*?)((?= \\/>)|(?=>))' % (node.xml.tagName, node.idref)
-        # offset = next(re.finditer(pat, self.text)).span()[0]
-        offset = self.text.find('id="' + (node.idref or node.id))
-        line_no = bisect.bisect_left(self.linebreaks, offset)
-        char = self.linebreaks[line_no] - offset
-        line_no += 1
-        return (line_no, char)
\ No newline at end of file
+        return locate(self.text, self.linebreaks, node)
+
+
+def locate(text, linebreaks, node):
+    """
+    Line of the first attribute with the id or referenced id of node, and
+    its distance to the end of that line
+    """
+    # pat = r'(?<=<)(%s[^\\/]*?xmi:idref="%s"[^\\/]*?)((?= \\/>)|(?=>))' % (node.xml.tagName, node.idref)
+    # offset = next(re.finditer(pat, text)).span()[0]
+    offset = text.find('id="' + (node.idref or node.id))
+    line_no = bisect.bisect_left(linebreaks, offset)
+    char = linebreaks[line_no] - offset
+    line_no += 1
+    return (line_no, char)
+
+
+# Snapshots of parsed documents, so that the scripts in the build pipeline
+# do not each parse the same XMI file. The directory can be set with
+# XMI_SNAPSHOT_DIR, an empty value disables snapshots.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = os.environ.get("XMI_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "xmi_snapshots"))
+SNAPSHOTS_KEPT = 4
+
+
+def file_hash(fn):
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def snapshot_path(fn):
+    return os.path.join(SNAPSHOT_DIR, "%s.v%d.pickle" % (file_hash(fn), SNAPSHOT_VERSION))
+
+
+@without_gc
+def read_snapshot(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+@without_gc
+def write_snapshot(d, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(d, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+    for old in sorted(glob.glob(os.path.join(SNAPSHOT_DIR, "*.pickle")), key=os.path.getmtime)[:-SNAPSHOTS_KEPT]:
+        try:
+            os.unlink(old)
+        except FileNotFoundError:
+            pass
+
+
+def load(fn):
+    """
+    Returns doc(fn), read from the snapshot keyed by the sha256 of the file
+    contents when available and otherwise parsed and stored as a snapshot.
+    """
+    if not SNAPSHOT_DIR:
+        return doc(fn)
+
+    path = snapshot_path(fn)
+    try:
+        d = read_snapshot(path)
+        d.fn = fn
+        return d
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # truncated, or written by an incompatible version of this module
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    d = doc(fn)
+    write_snapshot(d, path)
+    return d
+
+
+if __name__ == "__main__":
+    try:
+        fn = sys.argv[1]
+    except IndexError:
+        print("Usage: python xmi.py <schema.xml>", file=sys.stderr)
+        exit(1)
+
+    load(fn)
+    print(snapshot_path(fn))
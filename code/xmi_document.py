@@ -79,6 +79,8 @@ def yield_parents(node):
         yield from yield_parents(node.parentNode)
         
 def get_path(xmi_node):
+    if isinstance(xmi_node, xmi.element):
+        return list(xmi_node.get_path())
     nodes = list(yield_parents(xmi_node.xml))
     def get_name(n):
         if n.attributes:
@@ -174,11 +176,10 @@ class xmi_item:
         if self.parent and self.parent.type == "PSET" and self.type is None:
             return os.path.join(md_root, 'properties', self.name[0].lower(), self.name + ".md")
         else:
-            md_root = os.path.join(md_root, 'schemas')
-            for category in os.listdir(md_root):
-                for module in os.listdir(os.path.join(md_root, category)):
-                    if module == self.package:
-                        return os.path.join(md_root, category, module, self.mdtype, (self.parent.name if self.is_sub_element() else self.name) + ".md")
+            document = self.parent.document if self.is_sub_element(strict=True) else self.document
+            module = document.package_directories.get(self.package)
+            if module:
+                return os.path.join(module, self.mdtype, (self.parent.name if self.is_sub_element() else self.name) + ".md")
 
     def repo_root(self):
         fn = self.parent.document.filename if self.is_sub_element(strict=True) else self.document.filename
@@ -298,9 +299,11 @@ class xmi_document:
     
         if isinstance(fn, str):
             self.filename = fn
-            self.xmi = xmi.doc(fn)
+            self.xmi = xmi.load(fn)
+            self.extract_package_directories()
         else:
             self.xmi = fn
+            self.package_directories = {}
             
         self.extract_associations()
         self.extract_associations(concepts=True)
@@ -421,6 +424,18 @@ class xmi_document:
                         end_types = list(map(lambda c: (c|"type").idref, ends))
                         self.concept_associations[view_name][parent].append(end_types)
 
+    def extract_package_directories(self):
+        # docs/schemas/<category>/<package>, so that locating markdown does not list directories
+        self.package_directories = {}
+        md_root = os.path.join(os.path.abspath(os.path.dirname(self.filename)), '..', 'docs', 'schemas')
+        try:
+            for category in os.scandir(md_root):
+                if category.is_dir():
+                    for module in os.scandir(category.path):
+                        self.package_directories.setdefault(module.name, module.path)
+        except FileNotFoundError:
+            pass
+
     def extract_order(self):
         self.order = {k: int(v) for k, v in self.xmi.tags["ExpressOrdering"].items()}
 